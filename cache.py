@@ -0,0 +1,106 @@
+"""Caché en memoria con expiración (TTL) compartida por el proceso."""
+
+import os
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Diccionario thread-safe con expiración por entrada.
+    ``get_or_load`` carga perezosamente y evita que varios hilos carguen la misma clave a la vez.
+    Un ``ttl`` <= 0 desactiva la caché (siempre se vuelve a cargar).
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._next_sweep = time.monotonic() + max(ttl, 0)
+
+    def _fresh(self, key, now):
+        # Llamar con self._lock tomado; una entrada vencida se descarta al consultarla
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] > now:
+            return entry
+        del self._data[key]
+        return None
+
+    def _sweep(self, now):
+        # Como mucho una vez por ttl: quita las claves vencidas que nadie volvió a consultar
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.ttl
+        for key in [k for k, (expires, _) in self._data.items() if expires <= now]:
+            del self._data[key]
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._fresh(key, time.monotonic())
+        return entry[1] if entry else default
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            self._data[key] = (now + self.ttl, value)
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            entry = self._fresh(key, time.monotonic())
+            if entry:
+                return entry[1]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._fresh(key, time.monotonic())
+            if entry:
+                return entry[1]
+            try:
+                value = loader()
+                self.set(key, value)
+                return value
+            finally:
+                # Los que ya esperan conservan su referencia; los siguientes encuentran la entrada
+                with self._lock:
+                    if self._key_locks.get(key) is key_lock:
+                        del self._key_locks[key]
+
+    def invalidate(self, key=None):
+        """Descarta una clave o, sin argumentos, toda la caché."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "ttl": self.ttl,
+                "entries": len(self._data),
+                "fresh": sum(1 for expires, _ in self._data.values() if expires > now),
+            }
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_cache(env_var, default_ttl):
+    """
+    TTLCache compartido del proceso identificado por ``env_var``.
+    El TTL se lee del entorno en el primer uso (ya cargado el .env).
+    """
+    with _shared_lock:
+        cache = _shared.get(env_var)
+        if cache is None:
+            cache = TTLCache(float(os.getenv(env_var, str(default_ttl))))
+            _shared[env_var] = cache
+        return cache
@@ -0,0 +1,453 @@
+"""Réplica local (SQLite) del catálogo de Odoo para las lecturas más frecuentes.
+
+Un hilo en segundo plano trae solo los registros cuyo write_date es posterior al
+último cursor sincronizado (con una ventana de relectura hacia atrás), relee las
+variantes de los templates que cambiaron y, cada cierto tiempo, concilia los ids
+para quitar los registros borrados en Odoo. Los endpoints de catálogo leen de la réplica a
+través de ``MirrorSession``, que entiende el subconjunto de ``execute_kw``
+(``search_read`` y ``read`` con dominios simples) que esos endpoints usan.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Campos replicados por modelo (además de id y write_date); incluyen los del orden por defecto
+MIRRORED_MODELS = {
+    "product.public.category": ["name", "parent_id", "sequence"],
+    "product.template": ["name", "list_price", "attribute_line_ids", "product_variant_ids",
+                         "public_categ_ids", "website_published", "active", "priority"],
+    "product.product": ["name", "display_name", "list_price", "lst_price", "categ_id",
+                        "product_variant_id", "product_tmpl_id", "sale_ok", "active",
+                        "priority", "default_code"],
+    "product.template.attribute.line": ["attribute_id", "value_ids", "sequence"],
+    "product.attribute": ["name", "sequence"],
+    "product.attribute.value": ["name", "attribute_id", "sequence"],
+    "product.pricelist.item": ["pricelist_id", "product_tmpl_id", "fixed_price", "active",
+                               "applied_on", "min_quantity", "categ_id"],
+}
+# `_order` de cada modelo en Odoo: el que usa search_read cuando no se pasa `order`
+DEFAULT_ORDERS = {
+    "product.public.category": "sequence, name, id",
+    "product.template": "priority desc, name, id",
+    "product.product": "priority desc, default_code, name, id",
+    "product.template.attribute.line": "sequence, attribute_id, id",
+    "product.attribute": "sequence, id",
+    "product.attribute.value": "attribute_id, sequence, id",
+    "product.pricelist.item": "applied_on, min_quantity desc, categ_id desc, id desc",
+}
+# Un many2one se ordena por el `_order` del modelo relacionado
+MANY2ONE_ORDER = {
+    # product.category se ordena por complete_name, que es su nombre mostrado
+    "categ_id": ["json_extract(data, '$.categ_id[1]')"],
+    "attribute_id": [
+        "(SELECT json_extract(a.data, '$.sequence') FROM records a"
+        " WHERE a.model = 'product.attribute' AND a.id = json_extract(records.data, '$.attribute_id[0]'))",
+        "json_extract(data, '$.attribute_id[0]')",
+    ],
+}
+MANY2ONE_FIELDS = {"parent_id", "categ_id", "product_variant_id", "product_tmpl_id", "attribute_id", "pricelist_id"}
+X2MANY_FIELDS = {"attribute_line_ids", "product_variant_ids", "public_categ_ids", "value_ids"}
+ODOO_DATETIME = "%Y-%m-%d %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    model TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    write_date TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (model, id)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    model TEXT PRIMARY KEY,
+    write_date TEXT,
+    last_id INTEGER,
+    synced_at REAL
+);
+CREATE TABLE IF NOT EXISTS mirrored_fields (
+    model TEXT PRIMARY KEY,
+    fields TEXT NOT NULL
+);
+"""
+
+
+class MirrorUnsupported(ValueError):
+    """La consulta pide un campo u operador que la réplica no maneja."""
+
+
+def _collate_text(a, b):
+    # Aproxima la colación de PostgreSQL: primero sin distinguir mayúsculas
+    ka, kb = (a.casefold(), a), (b.casefold(), b)
+    return (ka > kb) - (ka < kb)
+
+
+class CatalogMirror:
+    def __init__(self, path, url, db, page_size=500, full_every=3600.0, overlap=300.0):
+        self.path = path
+        self.url = url
+        self.db = db
+        self.page_size = page_size
+        self.full_every = full_every
+        self.overlap = overlap
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_full = 0.0
+        self.last_error = None
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.create_collation("odoo", _collate_text)
+        return conn
+
+    def _conn(self):
+        # sqlite3 no comparte conexiones entre hilos: una por hilo
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # --- Sincronización -------------------------------------------------
+
+    def sync_once(self, odoo):
+        """
+        Trae los cambios de todos los modelos; concilia borrados cada `full_every` segundos.
+        Las variantes heredan o calculan campos del template (name, display_name, precios),
+        así que un template que cambió hace releer sus variantes y una variante que cambió
+        relee su template (product_variant_ids solo cuenta variantes activas).
+        """
+        with self._sync_lock:
+            reconcile = time.time() - self._last_full >= self.full_every
+            counts = {}
+            changed = {}
+            for model, fields in MIRRORED_MODELS.items():
+                self._check_fields(model, fields)
+                changed[model] = self._sync_model(odoo, model, ["id", "write_date", *fields])
+                counts[model] = len(changed[model])
+                if reconcile:
+                    self._reconcile(odoo, model)
+
+            if reconcile:
+                # Cota a lo que el write_date propio no refleja (p. ej. renombrar un valor de atributo,
+                # o archivar una lista de precios: `active` de sus reglas es un related almacenado)
+                self._refetch(odoo, "product.product", [])
+                self._refetch(odoo, "product.pricelist.item", [])
+            else:
+                template_ids = set(changed["product.template"])
+                if template_ids:
+                    self._refetch(odoo, "product.product", [["product_tmpl_id", "in", sorted(template_ids)]])
+            variant_templates = {
+                row["product_tmpl_id"][0] for row in self._rows("product.product", changed["product.product"])
+                if row.get("product_tmpl_id")
+            } - set(changed["product.template"])
+            if variant_templates:
+                self._refetch(odoo, "product.template", [["id", "in", sorted(variant_templates)]])
+
+            if reconcile:
+                self._last_full = time.time()
+            self.last_error = None
+            return counts
+
+    def _check_fields(self, model, fields):
+        """Si cambió la lista de campos replicados, reinicia el cursor para releer el modelo completo."""
+        conn = self._conn()
+        signature = json.dumps(sorted(fields))
+        row = conn.execute("SELECT fields FROM mirrored_fields WHERE model = ?", (model,)).fetchone()
+        if row and row[0] == signature:
+            return
+        conn.execute("DELETE FROM sync_state WHERE model = ?", (model,))
+        conn.execute("INSERT OR REPLACE INTO mirrored_fields (model, fields) VALUES (?, ?)", (model, signature))
+        conn.commit()
+
+    def _upsert(self, model, rows):
+        self._conn().executemany(
+            "INSERT OR REPLACE INTO records (model, id, write_date, data) VALUES (?, ?, ?, ?)",
+            [(model, r["id"], r["write_date"], json.dumps(r)) for r in rows],
+        )
+
+    def _rows(self, model, ids):
+        ids = list(ids)
+        rows = []
+        for start in range(0, len(ids), self.page_size):
+            chunk = ids[start:start + self.page_size]
+            rows.extend(json.loads(row[0]) for row in self._conn().execute(
+                "SELECT data FROM records WHERE model = ? AND id IN (%s)" % ",".join("?" * len(chunk)),
+                [model, *chunk],
+            ))
+        return rows
+
+    def _refetch(self, odoo, model, domain):
+        """Vuelve a leer los registros de `domain` (keyset por id) sin mover el cursor de write_date."""
+        fields = ["id", "write_date", *MIRRORED_MODELS[model]]
+        last_id = 0
+        while True:
+            rows = odoo.execute_kw(
+                model, "search_read", [domain + [["id", ">", last_id]]],
+                {"fields": fields, "order": "id asc", "limit": self.page_size,
+                 "context": {"active_test": False}}
+            )
+            if rows:
+                self._upsert(model, rows)
+                self._conn().commit()
+                last_id = rows[-1]["id"]
+            if len(rows) < self.page_size:
+                return
+
+    def _sync_model(self, odoo, model, fields):
+        """Sincroniza por (write_date, id) desde el cursor guardado; devuelve los ids leídos."""
+        conn = self._conn()
+        row = conn.execute("SELECT write_date, last_id FROM sync_state WHERE model = ?", (model,)).fetchone()
+        cursor = (row[0], row[1]) if row and row[0] else None
+
+        # Odoo fija write_date al iniciar la transacción: una transacción larga puede confirmar
+        # registros con write_date anterior al cursor. Se relee una ventana de `overlap` segundos.
+        write_date, last_id = None, 0
+        if cursor:
+            start = datetime.strptime(cursor[0], ODOO_DATETIME) - timedelta(seconds=self.overlap)
+            write_date = start.strftime(ODOO_DATETIME)
+
+        synced = []
+        while True:
+            domain = []
+            if write_date:
+                # Keyset por (write_date, id): no se pierden registros con el mismo write_date
+                domain = ['|', ['write_date', '>', write_date],
+                          '&', ['write_date', '=', write_date], ['id', '>', last_id]]
+            rows = odoo.execute_kw(
+                model, "search_read", [domain],
+                {"fields": fields, "order": "write_date asc, id asc", "limit": self.page_size,
+                 "context": {"active_test": False}}
+            )
+            if rows:
+                write_date, last_id = rows[-1]["write_date"], rows[-1]["id"]
+                self._upsert(model, rows)
+                synced.extend(r["id"] for r in rows)
+                # El cursor guardado nunca retrocede por la ventana de relectura
+                if cursor is None or (write_date, last_id) > cursor:
+                    cursor = (write_date, last_id)
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state (model, write_date, last_id, synced_at) VALUES (?, ?, ?, ?)",
+                (model, cursor[0] if cursor else None, cursor[1] if cursor else 0, time.time()),
+            )
+            conn.commit()
+            if len(rows) < self.page_size:
+                return synced
+
+    def _reconcile(self, odoo, model):
+        remote = set(odoo.execute_kw(model, "search", [[]], {"context": {"active_test": False}}))
+        conn = self._conn()
+        local = {row[0] for row in conn.execute("SELECT id FROM records WHERE model = ?", (model,))}
+        gone = local - remote
+        if gone:
+            conn.executemany("DELETE FROM records WHERE model = ? AND id = ?", [(model, i) for i in gone])
+            conn.commit()
+            logger.info("Réplica de catálogo: %d registros borrados de %s", len(gone), model)
+
+    def start(self, get_odoo, interval=60.0):
+        """Hilo daemon que sincroniza cada `interval` segundos."""
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.sync_once(get_odoo())
+                except Exception as e:
+                    self.last_error = getattr(e, "detail", None) or str(e)
+                    logger.exception("Error sincronizando la réplica de catálogo")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=run, name="catalog-mirror", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # --- Estado ---------------------------------------------------------
+
+    def synced_at(self):
+        """Momento (epoch) en que terminó la sincronización menos reciente de todos los modelos."""
+        rows = dict(self._conn().execute("SELECT model, synced_at FROM sync_state").fetchall())
+        if any(model not in rows for model in MIRRORED_MODELS):
+            return None
+        return min(rows.values())
+
+    def age(self):
+        synced_at = self.synced_at()
+        return None if synced_at is None else max(0.0, time.time() - synced_at)
+
+    def stats(self):
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT model, COUNT(*) FROM records GROUP BY model").fetchall())
+        state = {row[0]: {"write_date": row[1], "last_id": row[2], "synced_at": row[3]}
+                 for row in conn.execute("SELECT model, write_date, last_id, synced_at FROM sync_state")}
+        age = self.age()
+        return {
+            "path": self.path,
+            "age_seconds": None if age is None else round(age, 1),
+            "last_error": self.last_error,
+            "models": {model: {"records": counts.get(model, 0), **state.get(model, {})} for model in MIRRORED_MODELS},
+        }
+
+    def session(self):
+        return MirrorSession(self)
+
+
+class MirrorSession:
+    """Lecturas con la misma forma que ``OdooSession.execute_kw`` pero contra la réplica."""
+
+    def __init__(self, mirror):
+        self.mirror = mirror
+        self.url = mirror.url
+        self.db = mirror.db
+
+    def execute_kw(self, model, method, args, kwargs=None):
+        kwargs = kwargs or {}
+        fields = MIRRORED_MODELS.get(model)
+        if fields is None:
+            raise MirrorUnsupported(f"Modelo no replicado: {model}")
+        wanted = kwargs.get("fields") or ["id", "write_date", *fields]
+        unknown = set(wanted) - {"id", "write_date", *fields}
+        if unknown:
+            raise MirrorUnsupported(f"Campos no replicados en {model}: {sorted(unknown)}")
+
+        if method == "read":
+            ids = args[0] if isinstance(args[0], (list, tuple)) else [args[0]]
+            records = self._select(model, "id IN (%s)" % ",".join("?" * len(ids)), [int(i) for i in ids]) if ids else {}
+            by_id = {r["id"]: r for r in records}
+            return [self._project(by_id[i], wanted) for i in ids if i in by_id]
+
+        if method == "search_read":
+            domain = args[0] if args else []
+            where, params = self._where(model, domain, fields)
+            sql = where + " ORDER BY " + self._order_by(model, kwargs.get("order") or DEFAULT_ORDERS[model], fields)
+            if kwargs.get("limit"):
+                sql += " LIMIT %d" % int(kwargs["limit"])
+                if kwargs.get("offset"):
+                    sql += " OFFSET %d" % int(kwargs["offset"])
+            return [self._project(r, wanted) for r in self._select(model, sql, params)]
+
+        raise MirrorUnsupported(f"Método no soportado: {method}")
+
+    def _select(self, model, where, params):
+        rows = self.mirror._conn().execute(
+            f"SELECT data FROM records WHERE model = ? AND {where}", [model, *params]
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    @staticmethod
+    def _project(record, fields):
+        return {field: record.get(field, False) for field in ("id", *fields)}
+
+    def _where(self, model, domain, fields):
+        clauses, params = [], []
+        # Igual que Odoo (active_test): sin filtro explícito solo se ven registros activos
+        if "active" in fields and not any(isinstance(t, (list, tuple)) and t[0] == "active" for t in domain):
+            clauses.append("coalesce(json_extract(data, '$.active'), 1) = 1")
+        for term in domain:
+            if not isinstance(term, (list, tuple)) or len(term) != 3:
+                raise MirrorUnsupported(f"Término de dominio no soportado: {term!r}")
+            field, op, value = term
+            if field != "id" and field not in fields and field != "write_date":
+                raise MirrorUnsupported(f"Campo no replicado en {model}: {field}")
+            clause, clause_params = self._term(field, op, value)
+            clauses.append(clause)
+            params.extend(clause_params)
+        return " AND ".join(clauses) or "1 = 1", params
+
+    @staticmethod
+    def _order_by(model, order, fields):
+        """ORDER BY equivalente a `order` de Odoo (NULL al final en asc y al inicio en desc, como PostgreSQL)."""
+        terms = []
+        for part in order.split(","):
+            words = part.split()
+            if not words or len(words) > 2 or (len(words) == 2 and words[1].lower() not in ("asc", "desc")):
+                raise MirrorUnsupported(f"Orden no soportado: {order}")
+            field = words[0]
+            desc = len(words) == 2 and words[1].lower() == "desc"
+            if field == "id":
+                exprs = ["id"]
+            elif field in MANY2ONE_ORDER and field in fields:
+                exprs = MANY2ONE_ORDER[field]
+            elif field in MANY2ONE_FIELDS or field in X2MANY_FIELDS or (field not in fields and field != "write_date"):
+                raise MirrorUnsupported(f"Orden no soportado en {model}: {field}")
+            else:
+                # Odoo devuelve False por los valores vacíos: se ordenan como NULL
+                exprs = [f"CASE WHEN coalesce(json_type(data, '$.{field}'), 'null') IN ('false', 'null')"
+                         f" THEN NULL ELSE json_extract(data, '$.{field}') END"]
+            terms.extend(f"{expr} COLLATE odoo {'DESC NULLS FIRST' if desc else 'ASC NULLS LAST'}" for expr in exprs)
+        return ", ".join(terms)
+
+    @staticmethod
+    def _term(field, op, value):
+        if field == "id":
+            expr = "id"
+        elif field in MANY2ONE_FIELDS:
+            expr = f"json_extract(data, '$.{field}[0]')"
+        else:
+            expr = f"json_extract(data, '$.{field}')"
+
+        if isinstance(value, bool):
+            value = int(value)
+        if field in X2MANY_FIELDS:
+            if op != "in":
+                raise MirrorUnsupported(f"Operador no soportado en {field}: {op}")
+            values = list(value) if isinstance(value, (list, tuple)) else [value]
+            if not values:
+                return "0 = 1", []
+            return (f"EXISTS (SELECT 1 FROM json_each(data, '$.{field}') WHERE value IN ({','.join('?' * len(values))}))",
+                    values)
+        if op in ("in", "not in"):
+            values = list(value)
+            if not values:
+                return ("0 = 1" if op == "in" else "1 = 1"), []
+            sql_op = "IN" if op == "in" else "NOT IN"
+            return f"{expr} {sql_op} ({','.join('?' * len(values))})", values
+        if op == "=":
+            return f"{expr} = ?", [value]
+        if op in ("!=", "<>"):
+            # Como en Odoo, `!=` también incluye los registros sin valor
+            return f"({expr} IS NULL OR {expr} <> ?)", [value]
+        if op in (">", ">=", "<", "<="):
+            return f"{expr} {op} ?", [value]
+        raise MirrorUnsupported(f"Operador no soportado: {op}")
+
+
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+
+
+def register_mirror(mirror):
+    with _mirrors_lock:
+        _mirrors[(mirror.url, mirror.db)] = mirror
+    return mirror
+
+
+def fresh_mirror(url, db, max_lag=None):
+    """
+    Réplica de (url, db) si existe y su última sincronización tiene menos de
+    CATALOG_MIRROR_MAX_LAG segundos; si no, None (leer de Odoo).
+    """
+    with _mirrors_lock:
+        mirror = _mirrors.get((url, db))
+    if mirror is None:
+        return None
+    if max_lag is None:
+        max_lag = float(os.getenv("CATALOG_MIRROR_MAX_LAG", "300"))
+    age = mirror.age()
+    if age is None or age > max_lag:
+        return None
+    return mirror
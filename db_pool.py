@@ -0,0 +1,161 @@
+"""Pool de conexiones a SQL Server (pyodbc).
+
+Cada conexión nueva con Encrypt=yes paga un login TLS completo; el pool las
+reutiliza, verifica su estado al entregarlas y recicla las que llevan mucho
+tiempo inactivas.
+"""
+
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """No se liberó ninguna conexión dentro del tiempo de espera."""
+
+
+class PooledConnection:
+    """
+    Conexión prestada por el pool. Se usa igual que la de pyodbc: al salir del
+    ``with`` sin excepción hace commit (con excepción, rollback); después, o con
+    ``close()``, la devuelve al pool en vez de cerrarla.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise AttributeError(name)
+        return getattr(conn, name)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool._release(self._conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                # Como pyodbc: el with confirma lo escrito (el pool hace rollback al liberar)
+                if not self._conn.autocommit:
+                    self._conn.commit()
+            else:
+                try:
+                    self._conn.rollback()
+                except Exception:
+                    pass
+        finally:
+            self.close()
+        return False
+
+    def __del__(self):
+        # Red de seguridad: si alguien olvida close(), no perder el lugar en el pool
+        if not getattr(self, "_released", True):
+            self.close()
+
+
+class ConnectionPool:
+    def __init__(self, connect, size=5, timeout=30.0, max_idle=300.0, health_check="SELECT 1"):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_check = health_check
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []  # [(conn, released_at)], la más reciente al final
+        self._in_use = 0
+        self._stats = {"created": 0, "reused": 0, "recycled": 0, "failed_checks": 0, "timeouts": 0}
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeout(f"Pool de SQL Server agotado ({self.size} conexiones en uso)")
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+        return PooledConnection(self, conn)
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, released_at = self._idle.pop()
+            if time.monotonic() - released_at > self.max_idle:
+                self._discard(conn, "recycled")
+                continue
+            if self._healthy(conn):
+                with self._lock:
+                    self._stats["reused"] += 1
+                return conn
+            self._discard(conn, "failed_checks")
+
+        conn = self._connect()
+        with self._lock:
+            self._stats["created"] += 1
+        return conn
+
+    def _healthy(self, conn):
+        if not self.health_check:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.health_check)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn, reason):
+        with self._lock:
+            self._stats[reason] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _release(self, conn):
+        try:
+            # Descartar cualquier transacción que haya quedado abierta
+            conn.rollback()
+            broken = False
+        except Exception:
+            broken = True
+        with self._lock:
+            self._in_use -= 1
+            if not broken:
+                self._idle.append((conn, time.monotonic()))
+        if broken:
+            self._discard(conn, "failed_checks")
+        self._slots.release()
+
+    def close_idle(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                **self._stats,
+            }
@@ -0,0 +1,531 @@
+"""Utilidades para servir imágenes de productos y contactos.
+
+Las imágenes en disco se guardan una sola vez por contenido (sha256) en
+``<directorio>/.blobs/``; los nombres que lee el frontend (``{id}.png``,
+``img_{id}_{tipo}.png``) son hardlinks a esos archivos y ``.manifest.json``
+registra nombre -> hash y versión (write_date); varios procesos lo comparten
+bajo un lock de archivo (``.manifest.lock``). Para limpiar blobs sin uso:
+
+    python images.py gc ./images [--dry-run]
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from urllib.parse import quote
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Modelos de Odoo cuyas imágenes se pueden pedir por /odoo-image/
+IMAGE_MODELS = ("product.template", "product.product", "res.partner")
+# Imágenes de clientes: solo con el token firmado que entrega /auth/ en image_ref
+PRIVATE_IMAGE_MODELS = ("res.partner",)
+IMAGE_FIELDS = ("image_1920", "image_1024", "image_512", "image_256", "image_128")
+
+
+def image_ref(model: str, record: dict, token: str = None) -> dict:
+    """
+    Referencia a la imagen de un registro (sin los bytes).
+    `version` es el write_date del registro: cambia cuando cambia la imagen.
+    `token` (modelos privados) se agrega a la URL.
+    """
+    version = record.get("write_date") or ""
+    url = f"/odoo-image/{model}/{record['id']}?v={quote(version)}"
+    if token:
+        url += f"&token={quote(token)}"
+    return {
+        "model": model,
+        "id": record["id"],
+        "version": version,
+        "url": url,
+    }
+
+
+def detect_image_type(data: bytes) -> str:
+    """Content-Type a partir de la firma del archivo."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.lstrip()[:5] in (b"<?xml", b"<svg ") or data.lstrip()[:4] == b"<svg":
+        return "image/svg+xml"
+    return "application/octet-stream"
+
+
+def image_etag(data: bytes) -> str:
+    """ETag fuerte derivado del contenido (sha256)."""
+    return '"' + hashlib.sha256(data).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Compara un encabezado If-None-Match contra `etag` (comparación débil, como indica RFC 9110)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def write_if_changed(path: str, data: bytes) -> bool:
+    """
+    Escribe `data` de forma atómica (archivo temporal + rename) salvo que el archivo
+    ya tenga exactamente ese contenido. Devuelve True si escribió.
+    """
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    return False
+    except OSError:
+        pass
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+def blob_path(directory: str, digest: str) -> str:
+    """Ruta del archivo direccionado por contenido (sha256) dentro de `directory`."""
+    return os.path.join(directory, ".blobs", digest[:2], f"{digest}.png")
+
+
+def link_file(src: str, dst: str) -> None:
+    """
+    Deja `dst` apuntando al mismo contenido que `src`: hardlink si el sistema de
+    archivos lo permite, copia si no. El reemplazo es atómico.
+    """
+    # Nombre temporal único también entre procesos; se libera para poder crear el hardlink
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst) or ".", prefix=".tmp-", suffix=".part")
+    os.close(fd)
+    try:
+        try:
+            os.unlink(tmp_path)
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+MANIFEST_NAME = ".manifest.json"
+MANIFEST_LOCK_NAME = ".manifest.lock"
+
+
+@contextmanager
+def file_lock(path):
+    """Lock exclusivo entre procesos sobre `path` (fcntl en POSIX, msvcrt en Windows)."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK se rinde tras ~10 s; seguir esperando
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ImageStore:
+    """
+    Imágenes direccionadas por contenido con un manifiesto nombre -> {sha256, version}.
+    Contenido repetido se guarda una sola vez; `version` (write_date en Odoo) permite
+    saber si un archivo quedó desactualizado. ``flush()`` persiste el manifiesto.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._manifest = self._read_manifest()
+        self._dirty = set()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def _manifest_lock(self):
+        # Varios workers de uvicorn comparten el directorio: leer-mezclar-escribir bajo lock de archivo
+        return file_lock(os.path.join(self.directory, MANIFEST_LOCK_NAME))
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _has_blob(self, path, digest, blob):
+        try:
+            if os.path.samefile(path, blob):
+                return True
+        except OSError:
+            return False
+        # Sin hardlinks (copia): basta con que el manifiesto y el tamaño coincidan
+        entry = self._manifest.get(os.path.basename(path))
+        return bool(entry) and entry["sha256"] == digest and os.path.getsize(path) == os.path.getsize(blob)
+
+    def put(self, names, image_bytes: bytes, version=None):
+        """
+        Guarda `image_bytes` y deja cada nombre de `names` apuntando a ese contenido.
+        Devuelve (sha256, True si algún archivo cambió).
+        """
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        blob = blob_path(self.directory, digest)
+        if not os.path.isfile(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            write_if_changed(blob, image_bytes)
+
+        changed = False
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if not self._has_blob(path, digest, blob):
+                link_file(blob, path)
+                changed = True
+            entry = {"sha256": digest, "version": version}
+            with self._lock:
+                if self._manifest.get(name) != entry:
+                    self._manifest[name] = entry
+                    self._dirty.add(name)
+        return digest, changed
+
+    def put_empty(self, names, version=None):
+        """
+        Registra que `names` no tienen imagen en esa versión ({"sha256": None}) para no
+        volver a pedirlas a Odoo hasta que cambie; borra el archivo anterior si quedaba.
+        """
+        entry = {"sha256": None, "version": version}
+        for name in names:
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            with self._lock:
+                if self._manifest.get(name) != entry:
+                    self._manifest[name] = entry
+                    self._dirty.add(name)
+
+    def is_current(self, name, version=None) -> bool:
+        """
+        True si el archivo existe (o se registró que no hay imagen) y, si se pasa
+        `version`, corresponde a esa versión.
+        """
+        with self._lock:
+            entry = self._manifest.get(name)
+        if not entry or (version is not None and entry.get("version") != version):
+            return False
+        if entry.get("sha256") is None:
+            return True
+        return os.path.isfile(os.path.join(self.directory, name))
+
+    def flush(self):
+        """Escribe el manifiesto, mezclando con lo que otros procesos hayan guardado."""
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            with self._manifest_lock():
+                manifest = self._merge_dirty(self._read_manifest())
+                write_if_changed(self.manifest_path, json.dumps(manifest, sort_keys=True).encode("utf-8"))
+            self._manifest = manifest
+
+    def _merge_dirty(self, manifest):
+        # Llamar con self._lock tomado
+        for name in self._dirty:
+            if name in self._manifest:
+                manifest[name] = self._manifest[name]
+            else:
+                manifest.pop(name, None)
+        self._dirty.clear()
+        return manifest
+
+    def gc(self, dry_run=False, tmp_max_age=3600):
+        """
+        Quita del manifiesto los nombres cuyo archivo ya no existe, borra los blobs que
+        nadie referencia y los temporales abandonados. Devuelve conteos.
+        """
+        stats = {"entries_removed": 0, "blobs_removed": 0, "tmp_removed": 0, "bytes_freed": 0}
+        cutoff = time.time() - tmp_max_age
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, self._manifest_lock():
+            dirty = bool(self._dirty)
+            manifest = self._merge_dirty(self._read_manifest())
+            for name, entry in list(manifest.items()):
+                # Las entradas sin imagen (sha256 None) no tienen archivo a propósito
+                if entry.get("sha256") is not None and not os.path.isfile(os.path.join(self.directory, name)):
+                    stats["entries_removed"] += 1
+                    if not dry_run:
+                        del manifest[name]
+            if dirty or (not dry_run and stats["entries_removed"]):
+                write_if_changed(self.manifest_path, json.dumps(manifest, sort_keys=True).encode("utf-8"))
+            self._manifest = manifest
+            referenced = {entry["sha256"] for entry in manifest.values() if entry.get("sha256")}
+
+        blobs_dir = os.path.join(self.directory, ".blobs")
+        for root, _, files in os.walk(blobs_dir):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                st = os.stat(path)
+                digest = file_name.split(".", 1)[0]
+                # Un blob con más de un enlace todavía lo usa algún archivo (aunque no esté en el manifiesto);
+                # uno reciente puede ser de un put() de otro proceso que aún no enlaza ni guarda su manifiesto
+                if digest in referenced or st.st_nlink > 1 or st.st_mtime >= cutoff:
+                    continue
+                stats["blobs_removed"] += 1
+                stats["bytes_freed"] += st.st_size
+                if not dry_run:
+                    os.unlink(path)
+
+        for root, _, files in os.walk(self.directory):
+            for file_name in files:
+                if not (file_name.endswith(".tmp") or (file_name.startswith(".tmp-") and file_name.endswith(".part"))):
+                    continue
+                path = os.path.join(root, file_name)
+                if os.path.getmtime(path) < cutoff:
+                    stats["tmp_removed"] += 1
+                    if not dry_run:
+                        os.unlink(path)
+        return stats
+
+    def stats(self):
+        with self._lock:
+            return {
+                "names": len(self._manifest),
+                "blobs": len({entry["sha256"] for entry in self._manifest.values() if entry.get("sha256")}),
+                "empty": sum(1 for entry in self._manifest.values() if entry.get("sha256") is None),
+                "unsaved": len(self._dirty),
+            }
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_image_store(directory: str) -> ImageStore:
+    """Un ImageStore por directorio en todo el proceso (``images`` y ``./images/`` son el mismo)."""
+    key = os.path.abspath(directory)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            os.makedirs(directory, exist_ok=True)
+            store = _stores[key] = ImageStore(directory)
+        return store
+
+
+def image_file_name(id: int, tipo: str) -> str:
+    # Normalizar el nombre del tipo (sin espacios ni caracteres especiales)
+    tipo_clean = (tipo or "").lower().replace(" ", "_")
+    return f"img_{id}_{tipo_clean}.png"
+
+
+def save_image_to_disk(image_base64: str, id: int, tipo: str, directory: str = "images") -> str:
+    """ Guarda una imagen en base64 en el ImageStore de `directory` y devuelve su nombre de archivo con el formato `img_{id}_{tipo}.png`. """
+    try:
+        image_name = image_file_name(id, tipo)
+        store = get_image_store(directory)
+        store.put([image_name], base64.b64decode(image_base64))
+        store.flush()
+        return image_name
+    except Exception as e:
+        return f"Error guardando imagen {id}: {str(e)}"
+
+
+def _export_row(store, row):
+    id, image_base64, tipo = row
+    if not image_base64:
+        return "skipped", 0
+    image_bytes = base64.b64decode(image_base64)
+    _, changed = store.put([image_file_name(id, tipo)], image_bytes)
+    return ("written" if changed else "skipped"), len(image_bytes)
+
+
+def export_images(batches, directory="images", workers=4, max_pending=None, progress_every=500):
+    """
+    Exporta a disco filas (Id, image base64, Tipo) que llegan por lotes.
+    Decodifica y escribe en un pool de hilos con un máximo de filas pendientes,
+    así la memoria queda acotada aunque la tabla sea grande. Las imágenes
+    repetidas se guardan una sola vez (ImageStore).
+    Devuelve conteos y throughput.
+    """
+    store = get_image_store(directory)
+    max_pending = max_pending or workers * 4
+    stats = {"total": 0, "written": 0, "skipped": 0, "errors": 0, "bytes": 0}
+    error_samples = []
+    started = time.monotonic()
+
+    def collect(done):
+        for future in done:
+            try:
+                status, size = future.result()
+                stats[status] += 1
+                stats["bytes"] += size
+            except Exception as e:
+                stats["errors"] += 1
+                if len(error_samples) < 10:
+                    error_samples.append(str(e))
+            processed = stats["written"] + stats["skipped"] + stats["errors"]
+            if processed % progress_every == 0:
+                elapsed = time.monotonic() - started
+                logger.info("Exportación de imágenes: %d filas (%.1f filas/s)", processed, processed / elapsed if elapsed else 0)
+
+    pending = set()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in batches:
+                for row in batch:
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    pending.add(executor.submit(_export_row, store, tuple(row)))
+                    stats["total"] += 1
+            done, _ = wait(pending)
+            collect(done)
+    finally:
+        store.flush()
+
+    elapsed = time.monotonic() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["rows_per_sec"] = round(stats["total"] / elapsed, 1) if elapsed else None
+    stats["mb_per_sec"] = round(stats["bytes"] / 1048576 / elapsed, 2) if elapsed else None
+    if error_samples:
+        stats["error_samples"] = error_samples
+    return stats
+
+
+def iter_batches(cursor, size):
+    """Lotes de `fetchmany` hasta agotar el cursor."""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+class ImageMaterializer:
+    """
+    Escribe en segundo plano las imágenes de templates en un ImageStore.
+    `fetch(template_ids)` devuelve {template_id: image base64}; cada imagen se
+    decodifica una sola vez y se enlaza a los archivos de todas sus variantes.
+    Un template que ya está en cola no se vuelve a encolar, y uno sin imagen queda
+    registrado en el manifiesto con esa versión.
+    """
+
+    def __init__(self, store, fetch, workers=2, chunk_size=20):
+        self.store = store
+        self._fetch = fetch
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="images")
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._stats = {"queued": 0, "written": 0, "empty": 0, "errors": 0}
+
+    def submit(self, targets: dict, versions: dict = None) -> int:
+        """
+        Encola {template_id: [ids de archivo]} con su versión opcional {template_id: write_date};
+        devuelve cuántos templates se encolaron.
+        """
+        versions = versions or {}
+        with self._lock:
+            new = {tid: (ids, versions.get(tid)) for tid, ids in targets.items() if tid not in self._pending}
+            self._pending.update(new)
+            self._stats["queued"] += len(new)
+        items = list(new.items())
+        for start in range(0, len(items), self.chunk_size):
+            self._executor.submit(self._run, dict(items[start:start + self.chunk_size]))
+        return len(new)
+
+    def _run(self, chunk):
+        try:
+            images = self._fetch(list(chunk))
+            for template_id, (file_ids, version) in chunk.items():
+                image_base64 = images.get(template_id)
+                names = [f"{file_id}.png" for file_id in file_ids]
+                if not image_base64:
+                    # Sin imagen: queda registrado con su versión para no reencolarlo en cada consulta
+                    self.store.put_empty(names, version)
+                    self._count("empty")
+                    continue
+                try:
+                    self.store.put(names, base64.b64decode(image_base64), version)
+                    self._count("written")
+                except Exception:
+                    self._count("errors")
+                    logger.exception("Error guardando la imagen del template %s", template_id)
+        except Exception:
+            self._count("errors", len(chunk))
+            logger.exception("Error leyendo imágenes de %d templates", len(chunk))
+        finally:
+            self.store.flush()
+            with self._lock:
+                self._pending.difference_update(chunk)
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "pending": len(self._pending), **self._stats}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mantenimiento del almacén de imágenes direccionado por contenido.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gc_parser = sub.add_parser("gc", help="Borra blobs sin referencias y entradas de archivos que ya no existen")
+    gc_parser.add_argument("directory", help="Directorio de imágenes (p. ej. ./images)")
+    gc_parser.add_argument("--dry-run", action="store_true", help="Solo reporta lo que se borraría")
+    args = parser.parse_args(argv)
+
+    stats = ImageStore(args.directory).gc(dry_run=args.dry_run)
+    print(json.dumps(stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
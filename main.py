@@ -1,16 +1,38 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+import anyio.to_thread
 import pyodbc
 from pydantic import BaseModel, EmailStr
 from ProfileState import odoo_tela_items
+from model.o_categories import get_category_index
+from model.o_attributes import get_attribute_index
+from images import (
+    IMAGE_FIELDS, IMAGE_MODELS, PRIVATE_IMAGE_MODELS, ImageMaterializer, detect_image_type, etag_matches,
+    export_images, get_image_store, image_etag, image_ref, iter_batches,
+)
+import json
 import os
+import re
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import xmlrpc.client
+from odoo_client import OdooSession, OdooAuthError
+from db_pool import ConnectionPool
+from cache import shared_cache
+from catalog_mirror import CatalogMirror, fresh_mirror, register_mirror
+from reference_data import immediate_payment_term_id, portal_group_ids, refresh_reference_data, sale_tax_16_ids
+from quotation_pdf import OdooWebSession, PdfJobQueue, PdfQueueFull, render_quotation_pdf
+from pricing import (
+    compute_pricelist_price, compute_pricelist_prices, compute_prices_vectorized,
+    get_rule_index, invalidate_rule_index, rule_columns, rule_index_stats,
+)
 from datetime import datetime, timedelta
+from typing import Optional
 import jwt
 # Cargar las variables de entorno desde .env
 load_dotenv()
 import base64
-import requests
 #uvicorn main:app --host 0.0.0.0 --port 3036
 
 app = FastAPI()
@@ -22,8 +44,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Métodos permitidos (GET, POST, etc.)
     allow_headers=["*"],  # Encabezados permitidos
+    # Encabezados propios legibles desde el navegador (paginación y frescura del catálogo)
+    expose_headers=["X-Next-Cursor", "X-Catalog-Source", "X-Catalog-Age"],
 )
 
+# Los endpoints que hacen I/O bloqueante (XML-RPC, pyodbc, requests) se declaran con `def`
+# para que FastAPI los ejecute en el threadpool y no bloqueen el event loop.
+# WORKER_THREADS fija cuántas peticiones bloqueantes atiende en paralelo cada worker de uvicorn.
+@app.on_event("startup")
+async def configure_threadpool():
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(os.getenv("WORKER_THREADS", "40"))
+
+# Ocupación del threadpool del worker: hilos en uso y peticiones en cola
+@app.get("/metrics/threadpool")
+async def threadpool_metrics():
+    stats = anyio.to_thread.current_default_thread_limiter().statistics()
+    return {
+        "size": stats.total_tokens,
+        "busy": stats.borrowed_tokens,
+        "queued": stats.tasks_waiting,
+    }
+
 def get_odoo_url() -> str:
     """
     Normaliza ODOO_URL para evitar errores de protocolo XML-RPC.
@@ -40,6 +82,63 @@ def get_odoo_url() -> str:
 
     return raw_url.rstrip("/")
 
+def get_odoo_session() -> OdooSession:
+    """
+    Sesión de administrador compartida por todo el proceso.
+    Autentica solo la primera vez (o cuando Odoo rechaza las credenciales).
+    """
+    odoo = OdooSession.get(
+        get_odoo_url(),
+        os.getenv("ODOO_DB"),
+        os.getenv("ADMIN_USER"),
+        os.getenv("ADMIN_PASS"),
+    )
+    try:
+        odoo.uid
+    except OdooAuthError:
+        raise HTTPException(status_code=401, detail="Error de autenticación en Odoo")
+    return odoo
+
+_catalog_mirror = None
+_catalog_mirror_lock = threading.Lock()
+
+def get_catalog_mirror() -> Optional[CatalogMirror]:
+    """Réplica local del catálogo; solo existe con CATALOG_MIRROR=1."""
+    global _catalog_mirror
+    if os.getenv("CATALOG_MIRROR", "0").lower() not in ("1", "true", "yes"):
+        return None
+    with _catalog_mirror_lock:
+        if _catalog_mirror is None:
+            _catalog_mirror = register_mirror(CatalogMirror(
+                os.getenv("CATALOG_MIRROR_PATH", "./catalog_mirror.sqlite3"),
+                get_odoo_url(),
+                os.getenv("ODOO_DB"),
+                page_size=int(os.getenv("CATALOG_MIRROR_PAGE_SIZE", "500")),
+                full_every=float(os.getenv("CATALOG_MIRROR_FULL_EVERY", "3600")),
+                overlap=float(os.getenv("CATALOG_MIRROR_OVERLAP", "300")),
+            ))
+        return _catalog_mirror
+
+@app.on_event("startup")
+def start_catalog_mirror():
+    mirror = get_catalog_mirror()
+    if mirror is not None:
+        mirror.start(get_odoo_session, interval=float(os.getenv("CATALOG_MIRROR_INTERVAL", "60")))
+
+def catalog_source(response: Response):
+    """
+    Origen de las lecturas de catálogo: la réplica local si está al día
+    (CATALOG_MIRROR_MAX_LAG), si no, la sesión de Odoo. Lo indica en
+    X-Catalog-Source y, para la réplica, la antigüedad en X-Catalog-Age (segundos).
+    """
+    mirror = fresh_mirror(get_odoo_url(), os.getenv("ODOO_DB")) if get_catalog_mirror() else None
+    if mirror is not None:
+        response.headers["X-Catalog-Source"] = "mirror"
+        response.headers["X-Catalog-Age"] = str(int(mirror.age() or 0))
+        return mirror.session()
+    response.headers["X-Catalog-Source"] = "odoo"
+    return get_odoo_session()
+
 # Modelo para recibir datos en solicitudes POST
 class Item(BaseModel):
     name: str
@@ -57,7 +156,7 @@ class Product(BaseModel):
  # 0 => "7061"
 #]
 @app.post("/getOdooPrices")
-async def get_odoo_product_prices(data: dict):
+def get_odoo_product_prices(data: dict):
     """
     Recibe: {"ids": [id1, id2, ...], "partner_id": 123}
     - partner_id: ID del partner en Odoo, se usa para obtener su lista de precios actual
@@ -70,25 +169,14 @@ async def get_odoo_product_prices(data: dict):
         if not ids or not isinstance(ids, list):
             raise HTTPException(status_code=400, detail="Debes enviar un array de ids en 'ids'.")
 
-        url = get_odoo_url()
-        db = os.getenv('ODOO_DB')
-        admin_username = os.getenv('ADMIN_USER')
-        admin_password = os.getenv('ADMIN_PASS')
-
-        common = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/common")
-        uid = common.authenticate(db, admin_username, admin_password, {})
-        if not uid:
-            raise HTTPException(status_code=500, detail="Error al autenticar admin")
-
-        models = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/object")
+        odoo = get_odoo_session()
 
         # Resolver pricelist_id: prioridad a partner_id (consulta en vivo desde Odoo)
         pricelist_id = None
         partner_id = data.get("partner_id")
         if partner_id is not None:
             partner_id = int(partner_id)
-            partner_data = models.execute_kw(
-                db, uid, admin_password,
+            partner_data = odoo.execute_kw(
                 "res.partner", "read",
                 [[partner_id]],
                 {"fields": ["property_product_pricelist"]}
@@ -104,13 +192,15 @@ async def get_odoo_product_prices(data: dict):
                 pricelist_id = int(raw_pricelist)
 
         # Buscar todos los productos de una sola vez
-        products = models.execute_kw(
-            db, uid, admin_password,
+        products = odoo.execute_kw(
             "product.product", "search_read",
             [[["id", "in", ids]]],
             {"fields": ["id", "name", "list_price", "product_tmpl_id", "standard_price"]}
         )
 
+        # Reglas de la lista de precios para todos los productos en un solo lote
+        prices = compute_pricelist_prices(odoo, products, pricelist_id) if pricelist_id is not None else {}
+
         result = {}
         for prod in products:
             product_id = prod["id"]
@@ -118,7 +208,7 @@ async def get_odoo_product_prices(data: dict):
                 precio_unitario = prod.get("list_price")
                 result[product_id] = {"id": product_id, "price": precio_unitario, "name": prod.get("name")}
             else:
-                final_price, debug = compute_pricelist_price(models, db, uid, admin_password, prod, pricelist_id)
+                final_price, debug = prices[product_id]
                 if final_price is None:
                     result[product_id] = {"id": product_id, "price": None, "error": debug.get("error"), "debug": debug}
                 else:
@@ -135,31 +225,52 @@ async def get_odoo_product_prices(data: dict):
 def read_root():
     return {"message": "Welcome to FastAPI on port 3036!"}
 
+# Vuelve a resolver los ids de referencia cacheados (término de pago, impuesto 16%, grupo Portal)
+@app.post("/admin/reference-data/refresh")
+def refresh_reference_data_endpoint():
+    try:
+        return refresh_reference_data(get_odoo_session())
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Estado del pool de conexiones XML-RPC hacia Odoo
+@app.get("/metrics/odoo-pool")
+def odoo_pool_metrics():
+    return get_odoo_session().pool_stats()
+
+# Estado de la réplica de catálogo (registros y cursor por modelo, antigüedad, último error)
+@app.get("/metrics/catalog-mirror")
+def catalog_mirror_metrics():
+    mirror = get_catalog_mirror()
+    return mirror.stats() if mirror else {"enabled": False}
+
+# Sincroniza la réplica de inmediato, sin esperar al siguiente ciclo
+@app.post("/admin/catalog-mirror/sync")
+def sync_catalog_mirror():
+    mirror = get_catalog_mirror()
+    if mirror is None:
+        raise HTTPException(status_code=404, detail="La réplica de catálogo no está activa (CATALOG_MIRROR)")
+    try:
+        return {"status": "success", "synced": mirror.sync_once(get_odoo_session())}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/item/{item_name}")
-def read_item(item_name: str):
+def read_item(item_name: str, response: Response):
     # Aquí puedes usar el parámetro item_name que toma el valor de 'BLACKOUT'
     #return odoo_tela_items(item_name)
 
     #obtener datos de un item por su nombre de product.product y de product.template
     try:
-        # Obtener variables de entorno
-        url = get_odoo_url()
-        db = os.getenv('ODOO_DB')
-        admin_username = os.getenv('ADMIN_USER')
-        admin_password = os.getenv('ADMIN_PASS')
-
-        # Conectar con el servidor XML-RPC
-        common = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/common")
-        uid = common.authenticate(db, admin_username, admin_password, {})
-
-        if not uid:
-            raise HTTPException(status_code=500, detail="Error al autenticar admin")
-
-        models = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/object")
+        # Réplica local del catálogo si está al día; si no, sesión de administrador compartida
+        odoo = catalog_source(response)
         #item_name = item_name.strip()  # Eliminar espacios extra al inicio y al final del nombre del producto
         # Buscar el producto por nombre
-        product_data = models.execute_kw(
-            db, uid, admin_password,
+        product_data = odoo.execute_kw(
             "product.product", "search_read",
             [[["name", "=", item_name]]],
             {"fields": ["id", "name", "list_price", "product_tmpl_id"], "limit": 1}
@@ -172,15 +283,13 @@ def read_item(item_name: str):
         product_template_id = product_data[0]["product_tmpl_id"][0]  # Obtener el ID del template
 
         # Obtener datos del template
-        template_data = models.execute_kw(
-            db, uid, admin_password,
+        template_data = odoo.execute_kw(
             "product.template", "read",
             [product_template_id],
             {"fields": ["id", "name", "list_price"]}
         )
          #  Obtener el precio en la lista de precios con `compute_price`
-        pricelist_price = models.execute_kw(
-            db, uid, admin_password,
+        pricelist_price = odoo.execute_kw(
             "product.pricelist.item", "search_read",
             [[["pricelist_id", "=", 1], ["product_tmpl_id", "=", product_id]]],
             {"fields": ["fixed_price"]}
@@ -199,7 +308,7 @@ def read_item(item_name: str):
 
 
 # Configurar la conexión a SQL Server
-def get_db_connection():
+def _connect_db():
     return pyodbc.connect(
         f"DRIVER={{{os.getenv('DB_DRIVER')}}};"  # Nota: Sin espacios extra en las llaves
         f"SERVER={os.getenv('DB_SERVER')};"
@@ -210,127 +319,30 @@ def get_db_connection():
         "TrustServerCertificate=yes;"  # Si es necesario para evitar errores de certificados
     )
 
-
-# Helper: calcular precio de pricelist para un producto (devuelve precio final y debug)
-def compute_pricelist_price(models, db, admin_uid, admin_password, product_data, pricelist_id):
-    """product_data debe contener: id, name, list_price, product_tmpl_id, standard_price
-       Devuelve: (final_price, debug_dict)
-    """
-    try:
-        list_price = product_data.get("list_price", 0)
-        std_price = product_data.get("standard_price")
-        try:
-            std_price = float(std_price) if std_price is not None else None
-        except Exception:
-            std_price = None
-
-        # Calcular precio Directo (desde coste)
-        if std_price is not None:
-            direct_from_cost = std_price / 0.65 if 0.65 != 0 else std_price
-            if direct_from_cost < list_price:
-                direct_price = list_price
-                base_used = "list_price"
-            else:
-                direct_price = direct_from_cost
-                base_used = "standard_price"
-        else:
-            direct_price = list_price
-            base_used = "list_price"
-
-        # Buscar regla específica product.product
-        pricelist_item = models.execute_kw(
-            db, admin_uid, admin_password,
-            "product.pricelist.item", "search_read",
-            [[
-                ["pricelist_id", "=", pricelist_id],
-                ["product_id", "=", product_data.get("id")]
-            ]],
-            {"fields": ["fixed_price", "percent_price", "price_discount", "compute_price"], "limit": 1}
-        )
-        # fallback a product.template
-        if not pricelist_item and product_data.get("product_tmpl_id"):
-            tmpl = product_data["product_tmpl_id"]
-            tmpl_id = tmpl[0] if isinstance(tmpl, (list, tuple)) else tmpl
-            pricelist_item = models.execute_kw(
-                db, admin_uid, admin_password,
-                "product.pricelist.item", "search_read",
-                [[
-                    ["pricelist_id", "=", pricelist_id],
-                    ["product_tmpl_id", "=", tmpl_id]
-                ]],
-                {"fields": ["fixed_price", "percent_price", "price_discount", "compute_price"], "limit": 1}
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool() -> ConnectionPool:
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = ConnectionPool(
+                _connect_db,
+                size=int(os.getenv("DB_POOL_SIZE", "5")),
+                timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+                max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
             )
+        return _db_pool
 
-        item = pricelist_item[0] if pricelist_item else None
-
-        def _apply_pricelist_item_to_base(base, it):
-            if it is None:
-                return None, None
-            if it.get("fixed_price") is not None:
-                return it["fixed_price"], None
-            if it.get("percent_price") is not None:
-                pct = it.get("percent_price") or 0
-                return base * (1 - (pct / 100.0)), pct
-            if it.get("price_discount") is not None:
-                disc = it.get("price_discount") or 0
-                if disc > 1:
-                    pct = disc
-                    return base * (1 - (pct / 100.0)), pct
-                else:
-                    pct = disc * 100.0
-                    return base * (1 - float(disc)), pct
-            return None, None
-
-        applied_pct = None
-        applied_fixed = None
-        final_price = list_price
-
-        if pricelist_id in (1, 2, 4):
-            defaults = {1: 0.0, 2: 7.0, 4: 19.0}
-            if item:
-                applied, pct = _apply_pricelist_item_to_base(direct_price, item)
-                if applied is not None:
-                    final_price = round(applied, 2)
-                    applied_pct = pct
-                    if item.get("fixed_price") is not None:
-                        applied_fixed = item.get("fixed_price")
-                else:
-                    if item.get("compute_price") == "percentage" and item.get("percent_price") is not None:
-                        pct = item.get("percent_price") or 0
-                        final_price = round(direct_price * (1 - (pct/100.0)), 2)
-                        applied_pct = pct
-                    else:
-                        final_price = round(direct_price * (1 - (defaults.get(pricelist_id, 0.0)/100.0)), 2)
-            else:
-                final_price = round(direct_price * (1 - (defaults.get(pricelist_id, 0.0)/100.0)), 2)
-        else:
-            # otras listas: aplicar regla si existe
-            if item:
-                applied, pct = _apply_pricelist_item_to_base(product_data.get("list_price", 0), item)
-                if applied is not None:
-                    final_price = round(applied, 2)
-                    applied_pct = pct
-                    if item.get("fixed_price") is not None:
-                        applied_fixed = item.get("fixed_price")
-                elif item.get("compute_price") == "percentage" and item.get("percent_price") is not None:
-                    pct = item.get("percent_price") or 0
-                    final_price = product_data.get("list_price", 0) * (1 - (pct / 100.0))
-                    applied_pct = pct
-
-        debug = {
-            "base_used": base_used,
-            "standard_price": std_price,
-            "list_price": list_price,
-            "direct_price_used": direct_price,
-            "pricelist_id": pricelist_id,
-            "applied_pricelist_item": True if (applied_fixed is not None or applied_pct is not None) else False,
-            "applied_pct": applied_pct,
-            "applied_fixed": applied_fixed
-        }
+def get_db_connection():
+    """Conexión prestada por el pool; `close()` o salir del `with` la devuelve al pool."""
+    return get_db_pool().acquire()
+
+# Estado del pool de conexiones a SQL Server
+@app.get("/metrics/db-pool")
+def db_pool_metrics():
+    return get_db_pool().stats()
 
-        return final_price, debug
-    except Exception as e:
-        return None, {"error": str(e)}
 
 # Ruta para obtener el userName de un usuario logueado, recibiendo el id del usuario y la contraseña con POST
 class AuthRequest(BaseModel):
@@ -338,38 +350,24 @@ class AuthRequest(BaseModel):
     password: str
 
 @app.post("/auth/")
-async def auth(data: AuthRequest):
+def auth(data: AuthRequest):
     user_id = data.user_id
     password = data.password
 
     try:
-        #  Obtener variables de entorno
-        url = get_odoo_url()
-        db = os.getenv('ODOO_DB')
-        admin_username = os.getenv('ADMIN_USER')
-        admin_password = os.getenv('ADMIN_PASS')
-
-        #  Conectar con el servidor XML-RPC
-        common = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/common")
+        #  Sesión de administrador compartida (uid cacheado por proceso)
+        odoo = get_odoo_session()
 
         #  Autenticación del usuario normal
-        uid = common.authenticate(db, user_id, password, {})
+        uid = odoo.authenticate_user(user_id, password)
         if not uid:
             raise HTTPException(status_code=401, detail="Credenciales inválidas")
 
-        #  Autenticación del usuario admin
-        admin_uid = common.authenticate(db, admin_username, admin_password, {})
-        if not admin_uid:
-            raise HTTPException(status_code=500, detail="Error al autenticar admin")
-
-        models = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/object")
-
-        #  Obtener el `partner_id` del usuario autenticado y la imagen
-        user_data = models.execute_kw(
-            db, admin_uid, admin_password,
+        #  Obtener el `partner_id` del usuario autenticado
+        user_data = odoo.execute_kw(
             "res.users", "read",
             [[uid]],
-           {"fields": ["partner_id", "image_1920"]}
+           {"fields": ["partner_id"]}
         )
 
         if not user_data or "partner_id" not in user_data[0]:
@@ -379,11 +377,10 @@ async def auth(data: AuthRequest):
 
 
         #  Obtener la información del cliente (partner)
-        cliente = models.execute_kw(
-            db, admin_uid, admin_password,
+        cliente = odoo.execute_kw(
             "res.partner", "read",
             [[partner_id]],  # Aquí sí pasamos el ID del partner en una lista
-            {"fields": ["id", "name", "property_product_pricelist", "x_studio_configuracin_cotizador", "image_1920"]}
+            {"fields": ["id", "name", "property_product_pricelist", "x_studio_configuracin_cotizador", "write_date"]}
         )
         #return cliente
 
@@ -396,7 +393,8 @@ async def auth(data: AuthRequest):
             "name": cliente[0]["name"],
             "price_list": cliente[0]["property_product_pricelist"],
             "config": cliente[0].get("x_studio_configuracin_cotizador", None),  # Usar get para evitar KeyError
-            "user_image": cliente[0].get("image_1920", None)  # Usar get para evitar KeyError
+            # Solo la referencia: los bytes se piden a /odoo-image/ cuando se necesitan
+            "user_image_ref": image_ref("res.partner", cliente[0], token=generar_token_imagen("res.partner", cliente[0]["id"]))
         }
 
     except Exception as e:
@@ -428,6 +426,34 @@ def generar_token_autologin(login: str) -> str:
     return jwt.encode(payload, secret, algorithm=AUTOLOGIN_ALGORITHM)
 
 
+def generar_token_imagen(model: str, record_id: int) -> Optional[str]:
+    """
+    JWT de corta duración (IMAGE_TOKEN_MINUTES) que autoriza ver la imagen de un registro
+    privado en /odoo-image/. Sin AUTOLOGIN_SECRET no se emite y esas imágenes quedan bloqueadas.
+    """
+    secret = os.getenv("AUTOLOGIN_SECRET")
+    if not secret:
+        return None
+    payload = {
+        "img": f"{model}:{record_id}",
+        "exp": datetime.utcnow() + timedelta(minutes=int(os.getenv("IMAGE_TOKEN_MINUTES", "60"))),
+    }
+    return jwt.encode(payload, secret, algorithm=AUTOLOGIN_ALGORITHM)
+
+def _validar_token_imagen(token: Optional[str], model: str, record_id: int) -> None:
+    secret = os.getenv("AUTOLOGIN_SECRET")
+    if not token or not secret:
+        raise HTTPException(status_code=403, detail="Se requiere un token para esta imagen")
+    try:
+        payload = jwt.decode(token, secret, algorithms=[AUTOLOGIN_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=403, detail="Token de imagen expirado")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=403, detail="Token de imagen inválido")
+    if payload.get("img") != f"{model}:{record_id}":
+        raise HTTPException(status_code=403, detail="El token no corresponde a esta imagen")
+
+
 class AutologinTokenRequest(BaseModel):
     """Solo para uso interno desde Laravel."""
     login: str
@@ -494,44 +520,85 @@ async def validate_autologin_token(data: ValidateTokenRequest):
 
 # Ruta para obtener la imagen de un producto en base64
 @app.get("/get-image/{id}")
-async def get_image(id: int):
+def get_image(id: int):
 
     if not os.getenv("DB_DRIVER"):
         raise ValueError("No se encontró la variable DB_DRIVER en el archivo .env")
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT image FROM RPT_ODOO_CORTINAS WHERE Id = ?", (id))
-    result = cursor.fetchone()
-    conn.close()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT image FROM RPT_ODOO_CORTINAS WHERE Id = ?", (id))
+        result = cursor.fetchone()
 
     if result:
         return {"image": result[0]}
     else:
         raise HTTPException(status_code=404, detail="Item not found")
 
-# Ruta para obtener el precio de un producto en una lista de precios específica
-@app.get("/product/{product_id}/price/{pricelist_id}")
-async def get_product_price(product_id: int, pricelist_id: int):
+def image_response(request: Request, image_bytes: bytes, private: bool = False) -> Response:
+    """Bytes de imagen con ETag fuerte y Cache-Control; 304 si el cliente ya tiene esa versión."""
+    etag = image_etag(image_bytes)
+    headers = {
+        "ETag": etag,
+        # Las imágenes privadas no deben quedar en caches compartidos (proxies/CDN)
+        "Cache-Control": f"{'private' if private else 'public'}, max-age={int(os.getenv('IMAGE_CACHE_MAX_AGE', '86400'))}",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=image_bytes, media_type=detect_image_type(image_bytes), headers=headers)
+
+# Igual que /get-image/{id} pero devuelve los bytes decodificados (sin JSON ni base64) y soporta GET condicional
+@app.get("/get-image/{id}/raw")
+def get_image_raw(id: int, request: Request):
+
+    if not os.getenv("DB_DRIVER"):
+        raise ValueError("No se encontró la variable DB_DRIVER en el archivo .env")
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT image FROM RPT_ODOO_CORTINAS WHERE Id = ?", (id))
+        result = cursor.fetchone()
+
+    if not result or not result[0]:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    return image_response(request, base64.b64decode(result[0]))
+
+# Ruta para obtener la imagen de un registro de Odoo (bytes, bajo demanda)
+@app.get("/odoo-image/{model}/{record_id}")
+def get_odoo_image(model: str, record_id: int, request: Request, size: str = "image_1920", token: Optional[str] = None):
+    if model not in IMAGE_MODELS:
+        raise HTTPException(status_code=400, detail=f"Modelo no permitido: {model}")
+    if size not in IMAGE_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Tamaño no permitido: {size}")
+    private = model in PRIVATE_IMAGE_MODELS
+    if private:
+        _validar_token_imagen(token, model, record_id)
+
     try:
-        #  Obtener variables de entorno
-        url = get_odoo_url()
-        db = os.getenv('ODOO_DB')
-        admin_username = os.getenv('ADMIN_USER')
-        admin_password = os.getenv('ADMIN_PASS')
+        odoo = get_odoo_session()
+        records = odoo.execute_kw(
+            model, "read",
+            [[record_id]],
+            {"fields": [size]}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        #  Conectar con el servidor XML-RPC
-        common = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/common")
-        admin_uid = common.authenticate(db, admin_username, admin_password, {})
+    if not records or not records[0].get(size):
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
 
-        if not admin_uid:
-            raise HTTPException(status_code=500, detail="Error al autenticar admin")
+    return image_response(request, base64.b64decode(records[0][size]), private=private)
 
-        models = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/object")
+# Ruta para obtener el precio de un producto en una lista de precios específica
+@app.get("/product/{product_id}/price/{pricelist_id}")
+def get_product_price(product_id: int, pricelist_id: int):
+    try:
+        #  Sesión de administrador compartida
+        odoo = get_odoo_session()
 
         # Buscar producto y calcular precio usando helper
-        product_data = models.execute_kw(
-            db, admin_uid, admin_password,
+        product_data = odoo.execute_kw(
             "product.product", "search_read",
             [[["id", "=", product_id]]],
             {"fields": ["id", "name", "list_price", "product_tmpl_id", "standard_price"], "limit": 1}
@@ -541,7 +608,7 @@ async def get_product_price(product_id: int, pricelist_id: int):
             raise HTTPException(status_code=404, detail="Producto no encontrado")
 
         prod = product_data[0]
-        final_price, debug = compute_pricelist_price(models, db, admin_uid, admin_password, prod, pricelist_id)
+        final_price, debug = compute_pricelist_price(odoo, prod, pricelist_id)
 
         if final_price is None:
             raise HTTPException(status_code=500, detail=f"Error calculando precio: {debug.get('error')}")
@@ -556,139 +623,299 @@ async def get_product_price(product_id: int, pricelist_id: int):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Ruta para guardar todas las imágenes de la tabla RPT_ODOO_CORTINAS en disco
-@app.get("/save-all-images")
-async def get_all_images():
-    if not os.getenv("DB_DRIVER"):
-        raise ValueError("No se encontró la variable DB_DRIVER en el archivo .env")
+# Exporta el precio de todas las variantes activas y vendibles en una lista de precios (cálculo vectorizado)
+@app.get("/pricelist/{pricelist_id}/prices")
+def export_pricelist_prices(pricelist_id: int):
+    try:
+        odoo = get_odoo_session()
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT Id, image, Tipo FROM RPT_ODOO_CORTINAS")
-    results = cursor.fetchall()
-    conn.close()
+        products = odoo.execute_kw(
+            "product.product", "search_read",
+            [[["active", "=", True], ["sale_ok", "=", True]]],
+            {"fields": ["id", "list_price", "product_tmpl_id", "standard_price"]}
+        )
+        if not products:
+            return []
 
-    if not results:
-        raise HTTPException(status_code=404, detail="No se encontraron imágenes")
+        columns = rule_columns(products, get_rule_index(odoo, pricelist_id))
+        prices = compute_prices_vectorized(pricelist_id, **columns)
 
-    for row in results:
-        id, image_base64, tipo = row  # Asegúrate de capturar los tres valores correctamente
-        save_image_to_disk(image_base64, id, tipo)  # Pasar 'tipo' a la función
+        return [{"id": p["id"], "price": price} for p, price in zip(products, prices.tolist())]
 
-    return {"ok"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-def save_image_to_disk(image_base64: str, id: int, tipo: str) -> str:
-    """ Guarda una imagen en base64 en disco y devuelve su nombre de archivo con el formato `img_{id}_{tipo}.png`. """
-    try:
-        image_bytes = base64.b64decode(image_base64)
+# Invalida el índice de reglas de listas de precios en memoria (todas o solo `pricelist_id`)
+@app.post("/admin/pricelist-cache/invalidate")
+def invalidate_pricelist_cache(pricelist_id: Optional[int] = None):
+    invalidate_rule_index(pricelist_id)
+    return {"status": "success", "pricelist_id": pricelist_id, "cache": rule_index_stats()}
 
-        # Normalizar el nombre del tipo (sin espacios ni caracteres especiales)
-        tipo_clean = tipo.lower().replace(" ", "_")
+# Ruta para guardar todas las imágenes de la tabla RPT_ODOO_CORTINAS en disco
+# Lee por lotes (fetchmany) y decodifica/escribe en paralelo; omite archivos que ya tienen el mismo contenido
+@app.get("/save-all-images")
+def get_all_images():
+    if not os.getenv("DB_DRIVER"):
+        raise ValueError("No se encontró la variable DB_DRIVER en el archivo .env")
 
-        image_name = f"img_{id}_{tipo_clean}.png"
-        image_path = os.path.join("images", image_name)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT Id, image, Tipo FROM RPT_ODOO_CORTINAS")
+        stats = export_images(
+            iter_batches(cursor, int(os.getenv("IMAGE_EXPORT_BATCH", "200"))),
+            "images",
+            workers=int(os.getenv("IMAGE_EXPORT_WORKERS", str(os.cpu_count() or 4))),
+        )
 
-        os.makedirs("images", exist_ok=True)
+    if not stats["total"]:
+        raise HTTPException(status_code=404, detail="No se encontraron imágenes")
 
-        with open(image_path, "wb") as image_file:
-            image_file.write(image_bytes)
+    return stats
+
+def _fold_name(text):
+    # Sin mayúsculas ni acentos, por si Odoo tiene activado unaccent en las búsquedas
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def _ilike_regex(value):
+    """Patrón equivalente a `ilike value` de Odoo: contiene, con `%`/`_` como comodines y `\\` como escape."""
+    parts = []
+    chars = iter(_fold_name(value))
+    for c in chars:
+        if c == "%":
+            parts.append(".*")
+        elif c == "_":
+            parts.append(".")
+        elif c == "\\":
+            parts.append(re.escape(next(chars, "\\")))
+        else:
+            parts.append(re.escape(c))
+    return re.compile("".join(parts), re.DOTALL)
 
-        return image_name
-    except Exception as e:
-        return f"Error guardando imagen {id}: {str(e)}"
+
+def _match_products_by_name(odoo, names, chunk_size=80):
+    """
+    Resuelve nombres contra product.product con `ilike` usando un dominio OR por bloque.
+    Devuelve {nombre: [candidatos]} en el orden de Odoo (el primero es el que devolvía la búsqueda individual).
+    Cada producto se asigna a las cláusulas que cumple según la misma regla de `ilike`.
+    """
+    matches = {}
+    unique_names = list(dict.fromkeys(n for n in names if n))
+    for start in range(0, len(unique_names), chunk_size):
+        chunk = unique_names[start:start + chunk_size]
+        domain = ["|"] * (len(chunk) - 1) + [["name", "ilike", name] for name in chunk]
+        products = odoo.execute_kw(
+            "product.product", "search_read",
+            [domain],
+            {"fields": ["id", "name"]}
+        )
+        folded = [(p, _fold_name(p.get("name"))) for p in products]
+        for name in chunk:
+            pattern = _ilike_regex(name)
+            matches[name] = [p for p, product_name in folded if pattern.search(product_name)]
+    return matches
 
 @app.get("/update_product_ids")
-async def update_odoo_product_ids():
+def update_odoo_product_ids():
     try:
         #  Conectar a Odoo
-        url = get_odoo_url()
-        db = os.getenv('ODOO_DB')
-        admin_username = os.getenv('ADMIN_USER')
-        admin_password = os.getenv('ADMIN_PASS')
+        odoo = get_odoo_session()
 
-        common = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/common")
-        admin_uid = common.authenticate(db, admin_username, admin_password, {})
+        #  Conectar a la BD y obtener todas las telas (conexión del pool, se devuelve al salir del with)
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT Id, Name FROM RPT_ODOO_CORTINAS")
+            telas = cursor.fetchall()
 
-        if not admin_uid:
-            raise HTTPException(status_code=500, detail="Error al autenticar en Odoo")
+            if not telas:
+                return {"message": "No hay telas pendientes de actualización"}
 
-        models = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/object")
+            #  Buscar todos los productos en Odoo por nombre (por bloques) y emparejar localmente
+            matches = _match_products_by_name(
+                odoo, [nombre_tela for _, nombre_tela in telas], int(os.getenv("ODOO_NAME_CHUNK", "80"))
+            )
 
-        #  Conectar a la BD y obtener todas las telas
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT Id, Name FROM RPT_ODOO_CORTINAS")
-        telas = cursor.fetchall()
+            productos_actualizados = []
+            ambiguos = []
+            updates = []
+            for id_tela, nombre_tela in telas:
+                candidates = matches.get(nombre_tela) or []
+                if not candidates:
+                    productos_actualizados.append({"id": id_tela, "name": nombre_tela, "error": "Producto no encontrado"})
+                    continue
 
-        if not telas:
-            return {"message": "No hay telas pendientes de actualización"}
+                product_id = candidates[0]["id"]
+                if len(candidates) > 1:
+                    ambiguos.append({
+                        "id": id_tela,
+                        "name": nombre_tela,
+                        "odoo_id": product_id,
+                        "candidates": [{"id": c["id"], "name": c["name"]} for c in candidates],
+                    })
+                updates.append((product_id, id_tela))
+
+            #  Actualizar todos los Odoo_id en una sola transacción
+            if updates:
+                cursor.fast_executemany = True
+                cursor.executemany("UPDATE RPT_ODOO_CORTINAS SET Odoo_id = ? WHERE Id = ?", updates)
+            conn.commit()
 
-        productos_actualizados = []
+        return {
+            "updated_products": productos_actualizados,
+            "updated": len(updates),
+            "unmatched": len(productos_actualizados),
+            "ambiguous": ambiguos,
+        }
 
-        for id_tela, nombre_tela in telas:
-            #  Buscar producto en Odoo por nombre
-            product_data = models.execute_kw(
-                db, admin_uid, admin_password,
-                "product.product", "search_read",
-                [[["name", "ilike", nombre_tela]]],
-                {"fields": ["id", "name"]}
-            )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-            if not product_data:
-                productos_actualizados.append({"id": id_tela, "name": nombre_tela, "error": "Producto no encontrado"})
-                continue
+def read_order_products(odoo, order_lines):
+    """UoM y nombre de todos los productos de las líneas en una sola llamada: {product_id: product}."""
+    product_ids = set()
+    for line in order_lines:
+        if line.get("type") == "note":
+            continue
+        if line.get("product_id") is None:
+            raise HTTPException(status_code=400, detail="Línea de producto sin product_id")
+        product_ids.add(int(line["product_id"]))
+
+    if not product_ids:
+        return {}
+    products = odoo.execute_kw(
+        "product.product", "search_read",
+        [[["id", "in", list(product_ids)]]],
+        {"fields": ["id", "name", "uom_id"]}
+    )
+    return {p["id"]: p for p in products}
 
-            product_id = product_data[0]["id"]
+def order_line_vals(line, products, use_product_name=False, tax_ids=None):
+    """Valores de sale.order.line para una línea del frontend (nota o producto)."""
+    if line.get("type") == "note":
+        return {
+            "name": (line.get("description") or ""),
+            "display_type": "line_note"
+        }
 
-            #  Actualizar la base de datos con el ID de Odoo
-            cursor.execute("UPDATE RPT_ODOO_CORTINAS SET Odoo_id = ? WHERE Id = ?", (product_id, id_tela))
-            conn.commit()
+    product_id = int(line["product_id"])
+    product = products.get(product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail=f"Producto con ID {product_id} no encontrado")
+
+    # Obtener UoM real del producto para evitar errores por product_uom fijo
+    vals = {
+        "product_id": product_id,
+        "name": ((product["name"] if use_product_name else line.get("description")) or ""),
+        "product_uom_qty": float(line.get("quantity") or 0),
+        "price_unit": float(line.get("price_unit") or 0),
+        "product_uom": product["uom_id"][0] if product.get("uom_id") else 1,
+    }
+    if tax_ids is not None:
+        vals["tax_id"] = [[6, 0, tax_ids]] if tax_ids else []
+    return vals
+
+def build_order_line_commands(odoo, order_lines, use_product_name=False, tax_ids=None):
+    """Comandos one2many `(0, 0, vals)` para crear todas las líneas junto con la cotización."""
+    products = read_order_products(odoo, order_lines)
+    return [
+        (0, 0, order_line_vals(line, products, use_product_name, tax_ids))
+        for line in order_lines
+    ]
+
+ORDER_LINE_DIFF_FIELDS = ["id", "sequence", "display_type", "product_id", "name",
+                          "product_uom_qty", "price_unit", "product_uom", "tax_id"]
+
+def _order_line_changes(current, vals):
+    """Campos de `vals` que difieren de la línea leída de Odoo (many2one como [id, nombre])."""
+    changes = {}
+    for field, value in vals.items():
+        if field == "display_type":
+            continue
+        existing = current.get(field)
+        if field == "tax_id":
+            wanted = set(value[0][2]) if value else set()
+            if set(existing or []) != wanted:
+                changes[field] = value
+        elif field in ("product_id", "product_uom"):
+            if (existing[0] if existing else False) != value:
+                changes[field] = value
+        elif field in ("product_uom_qty", "price_unit"):
+            if abs(float(existing or 0) - value) > 1e-9:
+                changes[field] = value
+        elif (existing or "") != value:
+            changes[field] = value
+    return changes
+
+def build_order_line_update_commands(odoo, order_id, order_lines, use_product_name=False, tax_ids=None):
+    """
+    Compara las líneas actuales de la cotización con las enviadas (por posición) y devuelve
+    solo los comandos one2many necesarios: `(1, id, vals)` para las líneas con algún cambio,
+    `(0, 0, vals)` y `(2, id)`.
+    Una línea cuyo tipo cambia (nota <-> producto) se reemplaza, porque Odoo no permite
+    cambiar `display_type`; en ese caso se fija `sequence` para conservar el orden.
+    Las líneas nuevas al final llevan `sequence` mayor que la última existente: con el
+    valor por defecto (10) quedarían en medio si las líneas se reordenaron en Odoo.
+    """
+    current_lines = odoo.execute_kw(
+        "sale.order.line", "search_read",
+        [[["order_id", "=", order_id]]],
+        {"fields": ORDER_LINE_DIFF_FIELDS, "order": "sequence, id"}
+    )
+    products = read_order_products(odoo, order_lines)
+    new_vals = [order_line_vals(line, products, use_product_name, tax_ids) for line in order_lines]
 
-            # productos_actualizados.append({
-            #     "id": id_tela,
-            #     "name": nombre_tela,
-            #     "odoo_id": product_id
-            # })
+    def same_kind(current, vals):
+        return (current.get("display_type") or False) == vals.get("display_type", False)
 
-        conn.close()
-        return {"updated_products": productos_actualizados}
+    # Reemplazar una línea intermedia la mandaría al final: en ese caso se renumera todo
+    resequence = any(
+        not same_kind(current, vals) for current, vals in zip(current_lines, new_vals)
+    )
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    last_sequence = max((current.get("sequence") or 0 for current in current_lines), default=0)
+
+    commands = []
+    summary = {"updated": 0, "created": 0, "deleted": 0, "unchanged": 0}
+    for position, vals in enumerate(new_vals):
+        if resequence:
+            vals["sequence"] = (position + 1) * 10
+        elif position >= len(current_lines):
+            vals["sequence"] = last_sequence + (position - len(current_lines) + 1)
+        current = current_lines[position] if position < len(current_lines) else None
+        if current and same_kind(current, vals):
+            if _order_line_changes(current, vals):
+                # price_unit y name son campos calculados que Odoo recalcula al cambiar producto,
+                # UoM o cantidad: se envían todos los valores de la línea para no perder el precio
+                # ni la descripción del frontend (sigue siendo un solo write)
+                commands.append((1, current["id"], {k: v for k, v in vals.items() if k != "display_type"}))
+                summary["updated"] += 1
+            else:
+                summary["unchanged"] += 1
+            continue
+        if current:
+            commands.append((2, current["id"]))
+            summary["deleted"] += 1
+        commands.append((0, 0, vals))
+        summary["created"] += 1
+
+    for current in current_lines[len(new_vals):]:
+        commands.append((2, current["id"]))
+        summary["deleted"] += 1
+    return commands, summary
 
 @app.post("/create-quotation-main/")
-async def create_quotation_main(data: dict):
+def create_quotation_main(data: dict):
     try:
-        # 🔹 Variables de entorno
-        ODOO_URL = get_odoo_url()
-        ODOO_DB = os.getenv("ODOO_DB")
-        ODOO_USER = os.getenv("ADMIN_USER")
-        ODOO_PASS = os.getenv("ADMIN_PASS")
-
-        # 🔹 Conectar con Odoo
-        common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
-        uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASS, {})
-        if not uid:
-            raise HTTPException(status_code=401, detail="Error de autenticación en Odoo")
-
-        models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
+        # 🔹 Sesión de Odoo compartida
+        odoo = get_odoo_session()
 
         # Valores seguros para evitar enviar None por XML-RPC
         partner_id = int(data.get("partner_id") or 1)
         pricelist_id = int(data.get("pricelist_id") or 1)
 
-        # 🔹 Buscar término de pago "Pago inmediato" (fallback en inglés)
-        immediate_payment_term = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "account.payment.term", "search",
-            [[["name", "ilike", "Pago inmediato"]]],
-            {"limit": 1}
-        )
-        if not immediate_payment_term:
-            immediate_payment_term = models.execute_kw(
-                ODOO_DB, uid, ODOO_PASS, "account.payment.term", "search",
-                [[["name", "ilike", "Immediate Payment"]]],
-                {"limit": 1}
-            )
+        # 🔹 Término de pago "Pago inmediato" (fallback en inglés), resuelto una vez por proceso
+        immediate_payment_term = immediate_payment_term_id(odoo)
 
         order_vals = {
             "partner_id": partner_id,
@@ -697,49 +924,21 @@ async def create_quotation_main(data: dict):
             "partner_shipping_id": partner_id,
         }
         if immediate_payment_term:
-            order_vals["payment_term_id"] = immediate_payment_term[0]
+            order_vals["payment_term_id"] = immediate_payment_term
+
+        # 🔹 Líneas como comandos one2many: la cotización y sus líneas se crean en una sola llamada
+        order_vals["order_line"] = build_order_line_commands(odoo, data["order_lines"])
 
         #🔹 Crear la cotización
-        order_id = models.execute_kw(ODOO_DB, uid, ODOO_PASS, "sale.order", "create", [order_vals])
+        order_id = odoo.execute_kw("sale.order", "create", [order_vals])
 
         if not order_id:
             raise HTTPException(status_code=500, detail="Error al crear la cotización")
-        # order_id = 102 # Esto es un ejemplo, deberías usar el ID real de la cotización creada
-        # 🔹 Crear líneas
-        for line in data["order_lines"]:
-            if line.get("type") == "note":
-                models.execute_kw(ODOO_DB, uid, ODOO_PASS, "sale.order.line", "create", [{
-                    "order_id": order_id,
-                    "name": (line.get("description") or ""),
-                    "display_type": "line_note"
-                }])
-            else:
-                # Obtener UoM real del producto para evitar errores por product_uom fijo
-                product_id = line.get("product_id")
-                if product_id is None:
-                    raise HTTPException(status_code=400, detail="Línea de producto sin product_id")
-                product = models.execute_kw(
-                    ODOO_DB, uid, ODOO_PASS, "product.product", "search_read",
-                    [[["id", "=", int(product_id)]]],
-                    {"fields": ["id", "uom_id"], "limit": 1}
-                )
-                if not product:
-                    raise HTTPException(status_code=404, detail=f"Producto con ID {product_id} no encontrado")
-                product_uom = product[0]["uom_id"][0] if product[0].get("uom_id") else 1
-
-                models.execute_kw(ODOO_DB, uid, ODOO_PASS, "sale.order.line", "create", [{
-                    "order_id": order_id,
-                    "product_id": int(product_id),
-                    "name": (line.get("description") or ""),
-                    "product_uom_qty": float(line.get("quantity") or 0),
-                    "price_unit": float(line.get("price_unit") or 0),
-                    "product_uom": product_uom
-                }])
         # 🔹 Leer totales de una cotizacion
 
-        order_data = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "sale.order", "search_read",
-            [[["id", "=", order_id]]],
+        order_data = odoo.execute_kw(
+            "sale.order", "read",
+            [[order_id]],
             {"fields": ["amount_untaxed", "amount_total", "amount_tax"]}
         )
 
@@ -760,85 +959,34 @@ async def create_quotation_main(data: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/create-quotation-products/")
-async def create_quotation_products(data: dict):
+def create_quotation_products(data: dict):
     try:
-        # 🔹 Variables de entorno
-        ODOO_URL = get_odoo_url()
-        ODOO_DB = os.getenv("ODOO_DB")
-        ODOO_USER = os.getenv("ADMIN_USER")
-        ODOO_PASS = os.getenv("ADMIN_PASS")
-
-        # 🔹 Conectar con Odoo
-        common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
-        uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASS, {})
-        if not uid:
-            raise HTTPException(status_code=401, detail="Error de autenticación en Odoo")
-
-        models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
+        # 🔹 Sesión de Odoo compartida
+        odoo = get_odoo_session()
 
         # Valores seguros para evitar enviar None por XML-RPC
         partner_id = int(data.get("partner_id") or 1)
         pricelist_id = int(data.get("pricelist_id") or 1)
 
-        # 🔹 Buscar término de pago "Pago inmediato" (fallback en inglés)
-        immediate_payment_term = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "account.payment.term", "search",
-            [[["name", "ilike", "Pago inmediato"]]],
-            {"limit": 1}
-        )
-        if not immediate_payment_term:
-            immediate_payment_term = models.execute_kw(
-                ODOO_DB, uid, ODOO_PASS, "account.payment.term", "search",
-                [[["name", "ilike", "Immediate Payment"]]],
-                {"limit": 1}
-            )
+        # 🔹 Término de pago "Pago inmediato" (fallback en inglés), resuelto una vez por proceso
+        immediate_payment_term = immediate_payment_term_id(odoo)
 
         order_vals = {
             "partner_id": partner_id,
             "pricelist_id": pricelist_id,
         }
         if immediate_payment_term:
-            order_vals["payment_term_id"] = immediate_payment_term[0]
+            order_vals["payment_term_id"] = immediate_payment_term
 
-        # 🔹 Crear la cotización en `sale.order`
-        order_id = models.execute_kw(ODOO_DB, uid, ODOO_PASS, "sale.order", "create", [order_vals])
+        # 🔹 Líneas de productos / notas como comandos one2many (el nombre de la línea es el del producto)
+        order_vals["order_line"] = build_order_line_commands(odoo, data["order_lines"], use_product_name=True)
+
+        # 🔹 Crear la cotización en `sale.order` junto con sus líneas
+        order_id = odoo.execute_kw("sale.order", "create", [order_vals])
 
         if not order_id:
             raise HTTPException(status_code=500, detail="Error al crear la cotización en Odoo")
 
-        # 🔹 Agregar líneas de productos / notas
-        for line in data["order_lines"]:
-            if line.get("type") == "note":
-                models.execute_kw(ODOO_DB, uid, ODOO_PASS, "sale.order.line", "create", [{
-                    "order_id": order_id,
-                    "name": (line.get("description") or ""),
-                    "display_type": "line_note"
-                }])
-            else:
-                product_id = line.get("product_id")
-                if product_id is None:
-                    raise HTTPException(status_code=400, detail="Línea de producto sin product_id")
-                product = models.execute_kw(
-                    ODOO_DB, uid, ODOO_PASS, "product.product", "search_read",
-                    [[["id", "=", int(product_id)]]],
-                    {"fields": ["id", "name", "uom_id"]}
-                )
-
-                if not product:
-                    raise HTTPException(status_code=404, detail=f"Producto con ID {product_id} no encontrado")
-
-                product_name = product[0]["name"]
-                product_uom = product[0]["uom_id"][0]
-
-                models.execute_kw(ODOO_DB, uid, ODOO_PASS, "sale.order.line", "create", [{
-                    "order_id": order_id,
-                    "product_id": int(product_id),
-                    "name": (product_name or ""),
-                    "product_uom_qty": float(line.get("quantity") or 0),
-                    "product_uom": product_uom,
-                    "price_unit": float(line.get("price_unit") or 0),
-                }])
-
         return {
             "status": "success",
             "message": "Cotización creada con éxito",
@@ -848,92 +996,137 @@ async def create_quotation_products(data: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def get_pdf_path() -> str:
+    return os.getenv("PDF_PATH", "C:\\xampp\\htdocs\\invtek_frontend\\public\\pdfs" if os.name == "nt" else "/var/www/html/invtek_frontend/public/pdfs")
+
+def get_odoo_web_session() -> OdooWebSession:
+    """Sesión web (cookie) de administrador compartida; se reautentica solo cuando expira."""
+    return OdooWebSession.get(
+        get_odoo_url(),
+        os.getenv("ODOO_DB"),
+        os.getenv("ADMIN_USER"),
+        os.getenv("ADMIN_PASS"),
+    )
+
 @app.get("/generate-quotation-pdf/{order_id}")
-async def generate_quotation_pdf(order_id: int):
+def generate_quotation_pdf(order_id: int):
     try:
-        ODOO_URL = get_odoo_url()
-        ODOO_DB = os.getenv("ODOO_DB")
-        ODOO_USER = os.getenv("ADMIN_USER")
-        ODOO_PASS = os.getenv("ADMIN_PASS")
-        PDF_PATH = os.getenv("PDF_PATH", "C:\\xampp\\htdocs\\invtek_frontend\\public\\pdfs" if os.name == "nt" else "/var/www/html/invtek_frontend/public/pdfs")
-
-        session = requests.Session()
-        session.headers.update({'Content-Type': 'application/json'})
-
-        # 🔹 Autenticación en Odoo para obtener sesión
-        login_payload = {
-            "jsonrpc": "2.0",
-            "method": "call",
-            "params": {
-                "db": ODOO_DB,
-                "login": ODOO_USER,
-                "password": ODOO_PASS,
-            }
-        }
-        session.post(f"{ODOO_URL}/web/session/authenticate", json=login_payload)
-
-        # 🔹 Descargar el PDF
-        pdf_response = session.get(f"{ODOO_URL}/report/pdf/sale.report_saleorder/{order_id}")
-        if pdf_response.status_code == 200:
-            pdf_filename = f"Cotizacion_{order_id}.pdf"
-            pdf_filepath = os.path.join(PDF_PATH, pdf_filename)
+        odoo = get_odoo_session()
 
-            os.makedirs(PDF_PATH, exist_ok=True)
-            with open(pdf_filepath, "wb") as f:
-                f.write(pdf_response.content)
+        # 🔹 Descarga por bloques directo a PDF_PATH; si la cotización no cambió se reutiliza el archivo
+        pdf_filename, cached = render_quotation_pdf(odoo, get_odoo_web_session(), order_id, get_pdf_path())
 
-            return {
-                "status": "success",
-                "pdf_name": pdf_filename
-            }
-        else:
-            raise HTTPException(status_code=500, detail="Error al generar el PDF")
+        return {
+            "status": "success",
+            "pdf_name": pdf_filename,
+            "cached": cached
+        }
 
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def _get_quotation_status_from_odoo(order_id: int):
-    ODOO_URL = get_odoo_url()
-    ODOO_DB = os.getenv("ODOO_DB")
-    ODOO_USER = os.getenv("ADMIN_USER")
-    ODOO_PASS = os.getenv("ADMIN_PASS")
-
-    common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
-    uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASS, {})
-    if not uid:
-        raise HTTPException(status_code=401, detail="Error de autenticación en Odoo")
-
-    models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
-    order_data = models.execute_kw(
-        ODOO_DB,
-        uid,
-        ODOO_PASS,
-        "sale.order",
-        "search_read",
-        [[["id", "=", int(order_id)]]],
-        {"fields": ["id", "name", "state"], "limit": 1},
-    )
-
-    if not order_data:
-        raise HTTPException(status_code=404, detail=f"No existe la cotización {order_id} en Odoo")
-
-    state = (order_data[0].get("state") or "").lower()
-    label_map = {
-        "draft": "en_revision",
-        "sent": "enviada",
-        "sale": "orden_venta",
-        "cancel": "cancelada",
-    }
-
+def _render_quotation_pdf_job(order_id: int):
+    return render_quotation_pdf(get_odoo_session(), get_odoo_web_session(), order_id, get_pdf_path())
+
+_pdf_jobs = None
+_pdf_jobs_lock = threading.Lock()
+
+def get_pdf_job_queue() -> PdfJobQueue:
+    global _pdf_jobs
+    with _pdf_jobs_lock:
+        if _pdf_jobs is None:
+            _pdf_jobs = PdfJobQueue(
+                _render_quotation_pdf_job,
+                workers=int(os.getenv("PDF_WORKERS", "4")),
+                max_pending=int(os.getenv("PDF_QUEUE_MAX", "100")),
+                keep_seconds=float(os.getenv("PDF_JOB_TTL", "3600")),
+            )
+        return _pdf_jobs
+
+# Generación de PDF en segundo plano: devuelve job_id de inmediato y se consulta el estado después.
+# Acepta {"order_id": int} o {"order_ids": [int, ...]}
+@app.post("/quotation-pdf/jobs")
+def submit_quotation_pdf_jobs(data: dict):
+    order_ids = data.get("order_ids")
+    if order_ids is None and data.get("order_id") is not None:
+        order_ids = [data["order_id"]]
+    if not order_ids:
+        raise HTTPException(status_code=400, detail="Se requiere order_id u order_ids")
+    try:
+        jobs = get_pdf_job_queue().submit_many(order_ids)
+    except PdfQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="order_ids debe ser una lista de enteros")
+    return {"status": "success", "jobs": jobs}
+
+# Estado de un trabajo: queued, running, done (con pdf_name) o failed (con error)
+@app.get("/quotation-pdf/jobs/{job_id}")
+def get_quotation_pdf_job(job_id: str):
+    job = get_pdf_job_queue().status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+@app.get("/metrics/pdf-jobs")
+def pdf_jobs_metrics():
+    return get_pdf_job_queue().stats()
+
+QUOTATION_STATUS_LABELS = {
+    "draft": "en_revision",
+    "sent": "enviada",
+    "sale": "orden_venta",
+    "cancel": "cancelada",
+}
+
+def _quotation_status(order: dict) -> dict:
+    state = (order.get("state") or "").lower()
     return {
-        "order_id": int(order_data[0]["id"]),
-        "name": order_data[0].get("name"),
+        "order_id": int(order["id"]),
+        "name": order.get("name"),
         "state": state,
-        "status": label_map.get(state, "en_revision"),
+        "status": QUOTATION_STATUS_LABELS.get(state, "en_revision"),
     }
 
+def _get_quotation_statuses(order_ids) -> dict:
+    """
+    Estado de varias cotizaciones: {order_id: estado}. Las que no existen no aparecen.
+    Usa una caché corta (QUOTATION_STATUS_TTL, segundos) y un solo search_read para el resto.
+    """
+    odoo = get_odoo_session()
+    cache = shared_cache("QUOTATION_STATUS_TTL", 15)
+    statuses = {}
+    missing = []
+    for order_id in dict.fromkeys(int(o) for o in order_ids):
+        status = cache.get((odoo.url, odoo.db, order_id))
+        if status is None:
+            missing.append(order_id)
+        else:
+            statuses[order_id] = status
+
+    if missing:
+        orders = odoo.execute_kw(
+            "sale.order",
+            "search_read",
+            [[["id", "in", missing]]],
+            {"fields": ["id", "name", "state"]},
+        )
+        for order in orders:
+            status = _quotation_status(order)
+            cache.set((odoo.url, odoo.db, status["order_id"]), status)
+            statuses[status["order_id"]] = status
+    return statuses
+
+def _get_quotation_status_from_odoo(order_id: int):
+    status = _get_quotation_statuses([order_id]).get(int(order_id))
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"No existe la cotización {order_id} en Odoo")
+    return status
+
 @app.get("/quotation-status/{order_id}")
-async def get_quotation_status(order_id: int):
+def get_quotation_status(order_id: int):
     try:
         return _get_quotation_status_from_odoo(order_id)
     except HTTPException:
@@ -942,7 +1135,7 @@ async def get_quotation_status(order_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/quotation-status")
-async def post_quotation_status(data: dict):
+def post_quotation_status(data: dict):
     """
     Compatibilidad para clientes que envían JSON:
     {
@@ -960,8 +1153,33 @@ async def post_quotation_status(data: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/quotation-status/bulk")
+def post_quotation_status_bulk(data: dict):
+    """
+    Estado de varias cotizaciones en una sola llamada:
+    {
+      "order_ids": [123, 124, ...]
+    }
+    Devuelve los estados en el mismo orden y las que no existen en `not_found`.
+    """
+    try:
+        order_ids = data.get("order_ids")
+        if not isinstance(order_ids, list):
+            raise HTTPException(status_code=400, detail="Debes enviar 'order_ids' como lista")
+        order_ids = [int(order_id) for order_id in order_ids]
+
+        statuses = _get_quotation_statuses(order_ids)
+        return {
+            "statuses": [statuses[order_id] for order_id in dict.fromkeys(order_ids) if order_id in statuses],
+            "not_found": [order_id for order_id in dict.fromkeys(order_ids) if order_id not in statuses],
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/sale-orders-by-partner")
-async def sale_orders_by_partner(data: dict):
+def sale_orders_by_partner(data: dict):
     """
     Recibe:
     {
@@ -987,23 +1205,10 @@ async def sale_orders_by_partner(data: dict):
         if not order_ids_int:
             return {"matching_order_ids": []}
 
-        ODOO_URL = get_odoo_url()
-        ODOO_DB = os.getenv("ODOO_DB")
-        ODOO_USER = os.getenv("ADMIN_USER")
-        ODOO_PASS = os.getenv("ADMIN_PASS")
-
-        common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
-        uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASS, {})
-        if not uid:
-            raise HTTPException(status_code=401, detail="Error de autenticación en Odoo")
-
-        models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
+        odoo = get_odoo_session()
 
         # sale.order.partner_id es Many2one: el dominio usa igualdad contra el id del partner
-        matching_ids = models.execute_kw(
-            ODOO_DB,
-            uid,
-            ODOO_PASS,
+        matching_ids = odoo.execute_kw(
             "sale.order",
             "search",
             [[["id", "in", order_ids_int], ["partner_id", "=", partner_id]]],
@@ -1017,25 +1222,14 @@ async def sale_orders_by_partner(data: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/create-contact/")
-async def create_contact(contact: dict):
+def create_contact(contact: dict):
     try:
-        # 🔹 Variables de entorno
-        ODOO_URL = get_odoo_url()
-        ODOO_DB = os.getenv("ODOO_DB")
-        ODOO_USER = os.getenv("ADMIN_USER")
-        ODOO_PASS = os.getenv("ADMIN_PASS")
-
-        # 🔹 Conexión con Odoo
-        common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
-        uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASS, {})
-        if not uid:
-            raise HTTPException(status_code=401, detail="Error de autenticación en Odoo")
-
-        models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
+        # 🔹 Sesión de Odoo compartida
+        odoo = get_odoo_session()
 
         # 🔹 Verificar si ya existe un contacto con ese correo
-        existing = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, 'res.partner', 'search_read',
+        existing = odoo.execute_kw(
+            'res.partner', 'search_read',
             [[['email', '=', contact["email"]]]],
             {'fields': ['id', 'name'], 'limit': 1}
         )
@@ -1048,18 +1242,8 @@ async def create_contact(contact: dict):
                 "partner_id": existing[0]["id"]
             }
 
-        # 🔹 Buscar término de pago "Pago inmediato" (fallback a inglés)
-        immediate_payment_term = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "account.payment.term", "search",
-            [[[["name", "ilike", "Pago inmediato"]]]],
-            {"limit": 1}
-        )
-        if not immediate_payment_term:
-            immediate_payment_term = models.execute_kw(
-                ODOO_DB, uid, ODOO_PASS, "account.payment.term", "search",
-                [[[["name", "ilike", "Immediate Payment"]]]],
-                {"limit": 1}
-            )
+        # 🔹 Término de pago "Pago inmediato" (fallback a inglés), resuelto una vez por proceso
+        immediate_payment_term = immediate_payment_term_id(odoo)
 
         # 🔹 Crear el nuevo contacto (incluyendo término de pago si se encontró)
         partner_vals = {
@@ -1067,10 +1251,10 @@ async def create_contact(contact: dict):
             'email': contact["email"],
         }
         if immediate_payment_term:
-            partner_vals['property_payment_term_id'] = immediate_payment_term[0]
+            partner_vals['property_payment_term_id'] = immediate_payment_term
 
-        partner_id = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, 'res.partner', 'create',
+        partner_id = odoo.execute_kw(
+            'res.partner', 'create',
             [partner_vals]
         )
 
@@ -1084,54 +1268,91 @@ async def create_contact(contact: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+SELLABLE_DOMAIN = [
+    ['active', '=', True],
+    ['sale_ok', '=', True],
+    ['categ_id', '<>', 66],
+]
+# Solo los campos que se devuelven
+SELLABLE_FIELDS = ['id', 'display_name', 'list_price', 'lst_price', 'categ_id', 'product_variant_id']
+
+def _sellable_item(prod: dict) -> dict:
+    # display_name ya incluye default_code, name y variantes
+    return {
+        "id": prod["id"],
+        "name": prod.get('display_name', ''),
+        "price": prod["list_price"],
+        "list_price": prod["lst_price"],
+        "categ_id": prod["categ_id"],
+        "variant_values": prod.get("product_variant_id", [])
+    }
+
+def _read_sellable_page(odoo, after_id: Optional[int], limit: int):
+    """Página de productos vendibles con id > after_id (keyset por id, sin offset)."""
+    domain = SELLABLE_DOMAIN + ([['id', '>', int(after_id)]] if after_id else [])
+    return odoo.execute_kw(
+        'product.product', 'search_read',
+        [domain],
+        {'fields': SELLABLE_FIELDS, 'order': 'id asc', 'limit': limit}
+    )
+
+def _iter_sellable_pages(odoo, first_page, page_size: int):
+    page = first_page
+    while page:
+        yield page
+        if len(page) < page_size:
+            return
+        page = _read_sellable_page(odoo, page[-1]["id"], page_size)
+
+def _json_array_chunks(pages):
+    yield b"["
+    first = True
+    for page in pages:
+        chunk = ",".join(json.dumps(_sellable_item(prod), ensure_ascii=False) for prod in page)
+        if not chunk:
+            continue
+        yield (chunk if first else "," + chunk).encode("utf-8")
+        first = False
+    yield b"]"
+
+def _ndjson_chunks(pages):
+    for page in pages:
+        if page:
+            yield "".join(json.dumps(_sellable_item(prod), ensure_ascii=False) + "\n" for prod in page).encode("utf-8")
+
 @app.get("/products/active/sellable")
-async def get_active_sellable_products():
+def get_active_sellable_products(response: Response, limit: Optional[int] = None, cursor: Optional[int] = None, format: str = "json"):
+    """
+    Productos activos y vendibles, leídos de Odoo por páginas de SELLABLE_PAGE_SIZE (keyset por id)
+    y enviados en streaming como arreglo JSON (default) o NDJSON (`format=ndjson`).
+    Con `limit` devuelve una sola página y, si hay más, el encabezado X-Next-Cursor con el
+    valor a enviar como `cursor` en la siguiente petición.
+    """
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format debe ser 'json' o 'ndjson'")
     try:
-        url = get_odoo_url()
-        db = os.getenv('ODOO_DB')
-        admin_username = os.getenv('ADMIN_USER')
-        admin_password = os.getenv('ADMIN_PASS')
-
-        common = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/common")
-        uid = common.authenticate(db, admin_username, admin_password, {})
+        odoo = catalog_source(response)
+        page_size = int(os.getenv("SELLABLE_PAGE_SIZE", "500"))
+
+        # El StreamingResponse no hereda los encabezados de `response`: se copian los del catálogo
+        headers = {k: v for k, v in response.headers.items() if k.lower().startswith("x-catalog-")}
+        # La primera página se lee antes de responder para que los errores de Odoo sigan siendo un 500
+        if limit is not None:
+            limit = max(1, min(limit, int(os.getenv("SELLABLE_MAX_LIMIT", "5000"))))
+            rows = _read_sellable_page(odoo, cursor, limit + 1)
+            if len(rows) > limit:
+                rows = rows[:limit]
+                headers["X-Next-Cursor"] = str(rows[-1]["id"])
+            pages = [rows]
+        else:
+            pages = _iter_sellable_pages(odoo, _read_sellable_page(odoo, cursor, page_size), page_size)
 
-        if not uid:
-            raise HTTPException(status_code=500, detail="Error al autenticar admin")
-
-        models = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/object")
-
-        # Buscar productos activos y vendibles con display_name y product_variant_id
-        products = models.execute_kw(
-            db, uid, admin_password,
-            'product.product', 'search_read',
-            [[
-                ['active', '=', True],
-                ['sale_ok', '=', True],
-                ['categ_id', '<>', 66],
-                #["name", "ilike", 'RIEL DE ALUMINIO A TECHO']
-            ]],
-            {'fields': ['id', 'variant_seller_ids', 'product_template_variant_value_ids', 'standard_price', 'display_name', 'categ_id', 'list_price', 'product_variant_id', 'product_variant_ids', 'lst_price']}
-        )
-        #return products
-        result = []
-        # Leer los valores de variante específicos de cada producto y cruzarlos con product_template_attribute_value_ids
-        for prod in products:
-            # Usar display_name directamente, ya que incluye default_code, name y variantes
-            display_name = prod.get('display_name', '')
-            variant_value_ids = prod.get("product_variant_id", [])
-            #variant_values_full = [variant_value_details[vid] for vid in variant_value_ids if vid in variant_value_details]
-            result.append({
-                "id": prod["id"],
-                "name": display_name,
-                "price": prod["list_price"],
-                "list_price": prod["lst_price"],
-                "categ_id": prod["categ_id"],
-                "variant_values": variant_value_ids
-            })
-
-        # Agregar los diccionarios de mapeo al resultado general
-        return result
+        if format == "ndjson":
+            return StreamingResponse(_ndjson_chunks(pages), media_type="application/x-ndjson", headers=headers)
+        return StreamingResponse(_json_array_chunks(pages), media_type="application/json", headers=headers)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1141,24 +1362,14 @@ class RegisterData(BaseModel):
     password: str
 
 @app.post("/register")
-async def register_user(data: RegisterData):
+def register_user(data: RegisterData):
     try:
         # 🔹 Configuración de conexión Odoo
-        ODOO_URL = get_odoo_url()
-        ODOO_DB = os.getenv("ODOO_DB")
-        ODOO_USER = os.getenv("ADMIN_USER")
-        ODOO_PASS = os.getenv("ADMIN_PASS")
-
-        common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
-        uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASS, {})
-        if not uid:
-            raise HTTPException(status_code=401, detail="Error de autenticación en Odoo")
-
-        models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
+        odoo = get_odoo_session()
 
         # 🔍 Verificar si el contacto ya existe por email
-        existing_contacts = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "res.partner", "search_read",
+        existing_contacts = odoo.execute_kw(
+            "res.partner", "search_read",
             [[["email", "=", data.user_id]]],
             {"fields": ["id", "email"], "limit": 1}
         )
@@ -1166,19 +1377,8 @@ async def register_user(data: RegisterData):
         if existing_contacts:
             raise HTTPException(status_code=409, detail="El usuario ya existe")
 
-        # Buscar el término de pago "Pago inmediato" en Odoo
-        immediate_payment_term = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "account.payment.term", "search",
-            [[["name", "ilike", "Pago inmediato"]]],
-            {"limit": 1}
-        )
-        # Fallback: buscar "Immediate Payment" (Odoo en inglés)
-        if not immediate_payment_term:
-            immediate_payment_term = models.execute_kw(
-                ODOO_DB, uid, ODOO_PASS, "account.payment.term", "search",
-                [[["name", "ilike", "Immediate Payment"]]],
-                {"limit": 1}
-            )
+        # Término de pago "Pago inmediato" en Odoo (cacheado por proceso)
+        immediate_payment_term = immediate_payment_term_id(odoo)
 
         # Crear contacto con término de pago inmediato
         partner_vals = {
@@ -1187,22 +1387,19 @@ async def register_user(data: RegisterData):
             "customer_rank": 1
         }
         if immediate_payment_term:
-            partner_vals["property_payment_term_id"] = immediate_payment_term[0]
+            partner_vals["property_payment_term_id"] = immediate_payment_term
 
-        partner_id = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "res.partner", "create",
+        partner_id = odoo.execute_kw(
+            "res.partner", "create",
             [partner_vals]
         )
 
         # 👤 Crear usuario en Odoo
         # Para que el usuario sea "Portal" (cliente que puede cotizar y comprar), debe pertenecer al grupo Portal.
         # El ID del grupo Portal suele ser 9, pero es mejor buscarlo dinámicamente.
-        portal_group = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "res.groups", "search",
-            [[["category_id.name", "=", "User types"], ["name", "=", "Portal"]]]
-        )
-        user_id = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "res.users", "create",
+        portal_group = portal_group_ids(odoo)
+        user_id = odoo.execute_kw(
+            "res.users", "create",
             [{
             "name": data.name,
             "login": data.user_id,
@@ -1214,8 +1411,8 @@ async def register_user(data: RegisterData):
         )
 
         # Obtener info del partner
-        cliente = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "res.partner", "read",
+        cliente = odoo.execute_kw(
+            "res.partner", "read",
             [[partner_id]],
             {"fields": ["id", "name", "property_product_pricelist"]}
         )
@@ -1231,9 +1428,10 @@ async def register_user(data: RegisterData):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/update-quotation-main/")
-async def update_quotation_main(data: dict):
+def update_quotation_main(data: dict):
     """
-    Actualiza una cotización existente: elimina todas las líneas y agrega las nuevas líneas y comentario.
+    Actualiza una cotización existente: compara las líneas actuales con las nuevas y
+    envía en un solo `write` únicamente las líneas modificadas, nuevas o eliminadas.
     Espera: {
         "order_id": int,
         "order_lines": [ ... ],  # igual que en create_quotation_1
@@ -1241,256 +1439,155 @@ async def update_quotation_main(data: dict):
     """
 
     try:
-        ODOO_URL = get_odoo_url()
-        ODOO_DB = os.getenv("ODOO_DB")
-        ODOO_USER = os.getenv("ADMIN_USER")
-        ODOO_PASS = os.getenv("ADMIN_PASS")
+        odoo = get_odoo_session()
 
-        common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
-        uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASS, {})
-        if not uid:
-            raise HTTPException(status_code=401, detail="Error de autenticación en Odoo")
-
-        models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
+        order_id = int(data["order_id"])
 
-        order_id = data["order_id"]
+        # Impuesto del 16% (cacheado por proceso)
+        tax_ids = sale_tax_16_ids(odoo)
+        commands, summary = build_order_line_update_commands(odoo, order_id, data["order_lines"], tax_ids=tax_ids)
 
-        # Forzar término de pago "Pago inmediato" en cada actualización
-        immediate_payment_term = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "account.payment.term", "search",
-            [[["name", "ilike", "Pago inmediato"]]],
-            {"limit": 1}
-        )
-        if not immediate_payment_term:
-            immediate_payment_term = models.execute_kw(
-                ODOO_DB, uid, ODOO_PASS, "account.payment.term", "search",
-                [[["name", "ilike", "Immediate Payment"]]],
-                {"limit": 1}
-            )
+        # Forzar término de pago "Pago inmediato" en cada actualización (id cacheado por proceso)
+        order_vals = {}
+        immediate_payment_term = immediate_payment_term_id(odoo)
         if immediate_payment_term:
-            models.execute_kw(
-                ODOO_DB, uid, ODOO_PASS, "sale.order", "write",
-                [[int(order_id)], {"payment_term_id": immediate_payment_term[0]}]
-            )
+            order_vals["payment_term_id"] = immediate_payment_term
+        if commands:
+            order_vals["order_line"] = commands
 
-        # 1. Buscar todas las líneas actuales de la cotización
-        line_ids = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "sale.order.line", "search",
-            [[["order_id", "=", order_id]]]
-        )
-        # 2. Eliminar todas las líneas existentes (deben ir como lista simple, no lista anidada)
-        if line_ids:
-            for lid in line_ids:
-                models.execute_kw(
-                    ODOO_DB, uid, ODOO_PASS, "sale.order.line", "unlink",
-                    [[lid]]
-                )
-
-        # 3. Crear nuevas líneas (igual que en create_quotation_1)
-        for line in data["order_lines"]:
-            if line.get("type") == "note":
-                models.execute_kw(ODOO_DB, uid, ODOO_PASS, "sale.order.line", "create", [{
-                    "order_id": order_id,
-                    "name": (line.get("description") or ""),
-                    "display_type": "line_note"
-                }])
-            else:
-                # Obtener UoM real del producto para evitar errores por product_uom fijo
-                product_id = line.get("product_id")
-                if product_id is None:
-                    raise HTTPException(status_code=400, detail="Línea de producto sin product_id")
-                product = models.execute_kw(
-                    ODOO_DB, uid, ODOO_PASS, "product.product", "search_read",
-                    [[["id", "=", int(product_id)]]],
-                    {"fields": ["id", "uom_id"], "limit": 1}
-                )
-                if not product:
-                    raise HTTPException(status_code=404, detail=f"Producto con ID {product_id} no encontrado")
-                product_uom = product[0]["uom_id"][0] if product[0].get("uom_id") else 1
-
-                # Buscar el impuesto del 16% en Odoo (solo una vez)
-                tax_ids = models.execute_kw(
-                    ODOO_DB, uid, ODOO_PASS, "account.tax", "search",
-                    [[["amount", "=", 16], ["type_tax_use", "in", ["sale", "all"]]]],
-                    {"limit": 1}
-                )
-                models.execute_kw(ODOO_DB, uid, ODOO_PASS, "sale.order.line", "create", [{
-                    "order_id": order_id,
-                    "product_id": int(product_id),
-                    "name": (line.get("description") or ""),
-                    "product_uom_qty": float(line.get("quantity") or 0),
-                    "price_unit": float(line.get("price_unit") or 0),
-                    "product_uom": product_uom,
-                    "tax_id": [[6, 0, tax_ids]] if tax_ids else []
-                }])
+        # Un solo write con el término de pago y los comandos de líneas
+        if order_vals:
+            odoo.execute_kw("sale.order", "write", [[order_id], order_vals])
 
         return {
             "status": "success",
             "message": "Cotización actualizada con éxito",
-            "order_id": order_id
+            "order_id": order_id,
+            "lines": summary
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/update-quotation-products/")
-async def update_quotation_products(data: dict):
+def update_quotation_products(data: dict):
     """
-    Actualiza una cotización de productos: elimina todas las líneas y agrega las nuevas líneas de productos.
+    Actualiza una cotización de productos: compara las líneas actuales con las nuevas y
+    envía en un solo `write` únicamente las líneas modificadas, nuevas o eliminadas.
     Espera: {
         "order_id": int,
         "order_lines": [ ... ]  # igual que en create_quotation_products
     }
     """
     try:
-        ODOO_URL = get_odoo_url()
-        ODOO_DB = os.getenv("ODOO_DB")
-        ODOO_USER = os.getenv("ADMIN_USER")
-        ODOO_PASS = os.getenv("ADMIN_PASS")
+        odoo = get_odoo_session()
 
-        common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
-        uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASS, {})
-        if not uid:
-            raise HTTPException(status_code=401, detail="Error de autenticación en Odoo")
-
-        models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
+        order_id = int(data["order_id"])
 
-        order_id = data["order_id"]
-
-        # Forzar término de pago "Pago inmediato" en cada actualización
-        immediate_payment_term = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "account.payment.term", "search",
-            [[["name", "ilike", "Pago inmediato"]]],
-            {"limit": 1}
+        # El nombre de cada línea de producto es el del producto, igual que al crear
+        commands, summary = build_order_line_update_commands(
+            odoo, order_id, data["order_lines"], use_product_name=True
         )
-        if not immediate_payment_term:
-            immediate_payment_term = models.execute_kw(
-                ODOO_DB, uid, ODOO_PASS, "account.payment.term", "search",
-                [[["name", "ilike", "Immediate Payment"]]],
-                {"limit": 1}
-            )
+
+        # Forzar término de pago "Pago inmediato" en cada actualización (id cacheado por proceso)
+        order_vals = {}
+        immediate_payment_term = immediate_payment_term_id(odoo)
         if immediate_payment_term:
-            models.execute_kw(
-                ODOO_DB, uid, ODOO_PASS, "sale.order", "write",
-                [[int(order_id)], {"payment_term_id": immediate_payment_term[0]}]
-            )
+            order_vals["payment_term_id"] = immediate_payment_term
+        if commands:
+            order_vals["order_line"] = commands
 
-        # 1. Buscar todas las líneas actuales de la cotización
-        line_ids = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS, "sale.order.line", "search",
-            [[["order_id", "=", order_id]]]
-        )
-        # 2. Eliminar todas las líneas existentes (deben ir como lista simple, no lista anidada)
-        if line_ids:
-            for lid in line_ids:
-                models.execute_kw(
-                    ODOO_DB, uid, ODOO_PASS, "sale.order.line", "unlink",
-                    [[lid]]
-                )
-
-        # 3. Crear nuevas líneas de productos / notas (igual que en create_quotation_products)
-        for line in data["order_lines"]:
-            if line.get("type") == "note":
-                models.execute_kw(ODOO_DB, uid, ODOO_PASS, "sale.order.line", "create", [{
-                    "order_id": order_id,
-                    "name": (line.get("description") or ""),
-                    "display_type": "line_note"
-                }])
-            else:
-                product_id = line.get("product_id")
-                if product_id is None:
-                    raise HTTPException(status_code=400, detail="Línea de producto sin product_id")
-                product = models.execute_kw(
-                    ODOO_DB, uid, ODOO_PASS, "product.product", "search_read",
-                    [[["id", "=", int(product_id)]]],
-                    {"fields": ["id", "name", "uom_id"]}
-                )
-
-                if not product:
-                    raise HTTPException(status_code=404, detail=f"Producto con ID {product_id} no encontrado")
-
-                product_name = product[0]["name"]
-                product_uom = product[0]["uom_id"][0]
-
-                models.execute_kw(ODOO_DB, uid, ODOO_PASS, "sale.order.line", "create", [{
-                    "order_id": order_id,
-                    "product_id": int(product_id),
-                    "name": (product_name or ""),
-                    "product_uom_qty": float(line.get("quantity") or 0),
-                    "product_uom": product_uom,
-                    "price_unit": float(line.get("price_unit") or 0),
-                }])
+        # Un solo write con el término de pago y los comandos de líneas
+        if order_vals:
+            odoo.execute_kw("sale.order", "write", [[order_id], order_vals])
 
         return {
             "status": "success",
             "message": "Cotización de productos actualizada con éxito",
-            "order_id": order_id
+            "order_id": order_id,
+            "lines": summary
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+_fanout_executor = None
+_fanout_lock = threading.Lock()
+
+def run_concurrently(*calls):
+    """
+    Ejecuta llamadas independientes (lecturas a Odoo) en un pool acotado de
+    ODOO_FANOUT_WORKERS hilos y devuelve sus resultados en el mismo orden.
+    """
+    global _fanout_executor
+    with _fanout_lock:
+        if _fanout_executor is None:
+            _fanout_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("ODOO_FANOUT_WORKERS", "8")), thread_name_prefix="odoo-fanout"
+            )
+    futures = [_fanout_executor.submit(call) for call in calls]
+    return [future.result() for future in futures]
+
+def get_categ_image_path() -> str:
+    return os.getenv("CATEG_IMAGE_PATH", "./images/") # Ruta para guardar imágenes de productos
+
+def _fetch_template_images(template_ids):
+    return {
+        t['id']: t.get('image_1920')
+        for t in get_odoo_session().execute_kw(
+            'product.template', 'read',
+            [template_ids],
+            {'fields': ['id', 'image_1920']}
+        )
+    }
+
+_image_materializer = None
+_image_materializer_lock = threading.Lock()
+
+def get_image_materializer() -> ImageMaterializer:
+    global _image_materializer
+    with _image_materializer_lock:
+        if _image_materializer is None:
+            _image_materializer = ImageMaterializer(
+                get_image_store(get_categ_image_path()),
+                _fetch_template_images,
+                workers=int(os.getenv("IMAGE_MATERIALIZE_WORKERS", "2")),
+            )
+        return _image_materializer
+
+@app.get("/metrics/image-materializer")
+def image_materializer_metrics():
+    return {**get_image_materializer().stats(), "store": get_image_store(get_categ_image_path()).stats()}
+
 @app.post("/products/by-category/")
-async def get_products_by_category(data: dict):
+def get_products_by_category(data: dict, response: Response):
     """
     Recibe: {"path_filter": "CORTINAS/SHADES/TELAS/BLACKOUT"}
-    Devuelve: [{id, name, price}]
-    Guarda la imagen en disco solo si no existe.
+    Devuelve: [{id, name, price, image_ref}]
+    Las imágenes que faltan en disco se descargan y guardan en segundo plano (ImageMaterializer).
     """
     try:
-        ODOO_URL = get_odoo_url()
-        ODOO_DB = os.getenv("ODOO_DB")
-        ODOO_USER = os.getenv("ADMIN_USER")
-        ODOO_PASS = os.getenv("ADMIN_PASS")
-        IMAGE_PATH = os.getenv("CATEG_IMAGE_PATH", "./images/") # Ruta para guardar imágenes de productos =
-
-        common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
-        uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASS, {})
+        IMAGE_PATH = get_categ_image_path()
 
-        if not uid:
-            raise HTTPException(status_code=401, detail="Error de autenticación en Odoo")
-
-        models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
+        # Metadatos desde la réplica local si está al día; las imágenes siempre desde Odoo
+        catalog = catalog_source(response)
 
         path_filter = data.get("path_filter", "")
         if not path_filter:
             raise HTTPException(status_code=400, detail="Debes enviar el filtro en 'path_filter'.")
 
-        # Obtener todas las categorías públicas y buscar la que coincide con el path
-        categories = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS,
-            'product.public.category', 'search_read',
-            [[]],
-            {'fields': ['id', 'name', 'parent_id']}
-        )
-        category_dict = {cat['id']: {'name': cat['name'], 'parent_id': cat['parent_id'][0] if cat['parent_id'] else None} for cat in categories}
-
-        def build_path(category_id):
-            path = []
-            while category_id:
-                category = category_dict[category_id]
-                path.insert(0, category['name'])
-                category_id = category['parent_id']
-            return '/'.join(path)
-
-        # Buscar el id de la categoría que coincide con el path_filter
-        category_paths = {cat_id: build_path(cat_id) for cat_id in category_dict}
-        category_id = None
-        for cid, path in category_paths.items():
-            if path_filter.strip() == path.strip():  # Comparación exacta del path completo
-                category_id = cid
-                break
+        # Buscar el id de la categoría cuyo path completo coincide exactamente (índice compartido en memoria)
+        category_id = get_category_index(catalog).find(path_filter)
 
         if not category_id:
             return []
         # return both
         #return {"0":category_paths , "1":category_id, "2":path_filter, "3":category_paths.get(category_id, "")}
         # Buscar productos publicados en esa categoría
-        products = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASS,
+        products = catalog.execute_kw(
             'product.template', 'search_read',
             [[["website_published", "=", True], ["public_categ_ids", "in", [category_id]]]],
-            {'fields': ['id', 'name', 'list_price', 'image_1920', 'attribute_line_ids', 'product_variant_ids']}
+            {'fields': ['id', 'name', 'list_price', 'write_date', 'attribute_line_ids', 'product_variant_ids']}
         )
 
         # Obtener product.product (variantes) desde los templates
@@ -1501,72 +1598,71 @@ async def get_products_by_category(data: dict):
             template_to_variants[p['id']] = variant_ids
             all_variant_ids.extend(variant_ids)
 
-        # Leer precios de variantes si existen
-        variant_prices = {}
-        if all_variant_ids:
-            variants = models.execute_kw(
-                ODOO_DB, uid, ODOO_PASS,
-                'product.product', 'read',
-                [all_variant_ids],
-                {'fields': ['id', 'list_price']}
-            )
-            for v in variants:
-                variant_prices[v['id']] = v.get('list_price', 0)
-
-        # Obtener todos los attribute_line_ids, luego leer líneas, atributos y valores para mapear nombres
+        # Obtener todos los attribute_line_ids para leer líneas y mapear nombres de atributos y valores
         all_line_ids = []
         for p in products:
             all_line_ids.extend(p.get('attribute_line_ids', []))
         all_line_ids = list(set(all_line_ids))
 
-        line_map = {}
-        attr_names = {}
-        value_names = {}
+        # Templates a los que les falta algún archivo o cuyo write_date cambió desde que se guardó:
+        # se descargan y escriben en segundo plano ({var_id}.png, o {template_id}.png si no tiene
+        # variantes) sin retrasar la respuesta
+        image_store = get_image_store(IMAGE_PATH)
+        missing_images = {}
+        for p in products:
+            file_ids = template_to_variants.get(p['id']) or [p['id']]
+            if not all(image_store.is_current(f"{file_id}.png", p.get('write_date')) for file_id in file_ids):
+                missing_images[p['id']] = file_ids
+        if missing_images:
+            get_image_materializer().submit(
+                missing_images, versions={p['id']: p.get('write_date') for p in products}
+            )
 
-        if all_line_ids:
-            lines = models.execute_kw(
-                ODOO_DB, uid, ODOO_PASS,
+        # Leer precios de variantes si existen
+        def read_variant_prices():
+            if not all_variant_ids:
+                return {}
+            variants = catalog.execute_kw(
+                'product.product', 'read',
+                [all_variant_ids],
+                {'fields': ['id', 'list_price']}
+            )
+            return {v['id']: v.get('list_price', 0) for v in variants}
+
+        def read_attribute_lines():
+            if not all_line_ids:
+                return {}
+            lines = catalog.execute_kw(
                 'product.template.attribute.line', 'read',
                 [all_line_ids],
                 {'fields': ['id', 'attribute_id', 'value_ids']}
             )
-            # Recolectar ids de atributos y valores
-            attr_ids = set()
-            value_ids = set()
-            for line in lines:
-                line_map[line['id']] = line
-                if line.get('attribute_id'):
-                    # attribute_id puede venir como [id, name] o como id
-                    aid = line['attribute_id'][0] if isinstance(line['attribute_id'], (list, tuple)) else line['attribute_id']
-                    if aid:
-                        attr_ids.add(aid)
-                for vid in line.get('value_ids', []):
-                    value_ids.add(vid)
-
-            # Leer nombres de atributos
-            if attr_ids:
-                attrs = models.execute_kw(
-                    ODOO_DB, uid, ODOO_PASS,
-                    'product.attribute', 'read',
-                    [list(attr_ids)],
-                    {'fields': ['id', 'name']}
-                )
-                for a in attrs:
-                    attr_names[a['id']] = a['name']
-
-            # Leer nombres de valores
-            if value_ids:
-                vals = models.execute_kw(
-                    ODOO_DB, uid, ODOO_PASS,
-                    'product.attribute.value', 'read',
-                    [list(value_ids)],
-                    {'fields': ['id', 'name', 'attribute_id']}
-                )
-                for v in vals:
-                    # attribute_id puede venir como tupla
-                    value_names[v['id']] = {'name': v['name'], 'attribute_id': v.get('attribute_id')[0] if v.get('attribute_id') else None}
-
-        os.makedirs(IMAGE_PATH, exist_ok=True)
+            return {line['id']: line for line in lines}
+
+        # Lecturas independientes en paralelo: la latencia es la de la más lenta, no la suma
+        variant_prices, line_map, attribute_index = run_concurrently(
+            read_variant_prices,
+            read_attribute_lines,
+            lambda: get_attribute_index(catalog),
+        )
+
+        # Recolectar ids de atributos y valores
+        attr_ids = set()
+        value_ids = set()
+        for line in line_map.values():
+            if line.get('attribute_id'):
+                # attribute_id puede venir como [id, name] o como id
+                aid = line['attribute_id'][0] if isinstance(line['attribute_id'], (list, tuple)) else line['attribute_id']
+                if aid:
+                    attr_ids.add(aid)
+            for vid in line.get('value_ids', []):
+                value_ids.add(vid)
+
+        # Nombres de atributos y valores desde el índice cacheado; solo se leen de Odoo los ids nuevos
+        attribute_index.ensure(catalog, attr_ids, value_ids)
+        attr_names = attribute_index.attr_names
+        value_names = attribute_index.value_names
+
         result = []
 
         for product in products:
@@ -1599,16 +1695,10 @@ async def get_products_by_category(data: dict):
                     "template_id": product["id"],
                     "name": product["name"],
                     "price": variant_prices.get(var_id, product["list_price"]),
-                    "attributes": attributes
+                    "attributes": attributes,
+                    "image_ref": image_ref("product.template", product)
                 })
 
-                # Guardar imagen con el ID de la variante
-                image_name = f"{var_id}.png"
-                image_path = os.path.join(IMAGE_PATH, image_name)
-                if product.get('image_1920') and not os.path.isfile(image_path):
-                    with open(image_path, "wb") as image_file:
-                        image_file.write(base64.b64decode(product['image_1920']))
-
             # Si no hay variantes, devolver el template como fallback
             if not variant_ids:
                 result.append({
@@ -1616,16 +1706,10 @@ async def get_products_by_category(data: dict):
                     "template_id": product["id"],
                     "name": product["name"],
                     "price": product["list_price"],
-                    "attributes": attributes
+                    "attributes": attributes,
+                    "image_ref": image_ref("product.template", product)
                 })
 
-                # Guardar imagen con el ID del template
-                image_name = f"{product['id']}.png"
-                image_path = os.path.join(IMAGE_PATH, image_name)
-                if product.get('image_1920') and not os.path.isfile(image_path):
-                    with open(image_path, "wb") as image_file:
-                        image_file.write(base64.b64decode(product['image_1920']))
-
         return result
 
     except Exception as e:
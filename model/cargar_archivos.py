@@ -0,0 +1,183 @@
+"""Carga telas (name, image) desde un export JSON/NDJSON a RPT_ODOO_CORTINAS.
+
+Uso:
+    python model/cargar_archivos.py SHEER.json --tipo sheer
+    python model/cargar_archivos.py telas.ndjson --tipo blackout --batch-size 1000
+
+Lee el archivo de forma incremental (no lo carga completo en memoria), inserta
+por lotes con fast_executemany y hace upsert por nombre, así que volver a
+correrlo con el mismo archivo no duplica filas.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import pyodbc
+from dotenv import load_dotenv
+
+READ_CHUNK = 1 << 20
+
+
+def get_connection():
+    return pyodbc.connect(
+        f"DRIVER={{{os.getenv('DB_DRIVER')}}};"
+        f"SERVER={os.getenv('DB_SERVER')};"
+        f"DATABASE={os.getenv('DB_DATABASE')};"
+        f"UID={os.getenv('DB_USER')};"
+        f"PWD={os.getenv('DB_PASSWORD')};"
+    )
+
+
+def iter_json_array(f, chunk_size=READ_CHUNK):
+    """Elementos de un arreglo JSON de nivel superior, leídos por bloques."""
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_size)
+    pos = 0
+    eof = not buf
+
+    def skip_ws():
+        nonlocal buf, pos, eof
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            buf, pos = f.read(chunk_size), 0
+            eof = not buf
+
+    skip_ws()
+    if pos >= len(buf) or buf[pos] != "[":
+        raise ValueError("Se esperaba un arreglo JSON ('[') al inicio del archivo")
+    pos += 1
+    skip_ws()
+    if buf[pos:pos + 1] == "]":
+        return
+
+    while True:
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                # Un valor que termina justo al final del buffer podría estar cortado
+                if end < len(buf) or eof:
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            more = f.read(chunk_size)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+        yield item
+        pos = end
+
+        skip_ws()
+        if pos >= len(buf):
+            raise ValueError("Arreglo JSON sin cerrar")
+        if buf[pos] == "]":
+            return
+        if buf[pos] != ",":
+            raise ValueError(f"Se esperaba ',' o ']' en la posición {pos}")
+        pos += 1
+        skip_ws()
+
+
+def iter_ndjson(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_items(path, fmt="auto"):
+    with open(path, "r", encoding="utf-8") as f:
+        if fmt == "auto":
+            if path.lower().endswith((".ndjson", ".jsonl")):
+                fmt = "ndjson"
+            else:
+                head = f.read(READ_CHUNK).lstrip()
+                f.seek(0)
+                fmt = "json" if head.startswith("[") else "ndjson"
+        if fmt == "json":
+            yield from iter_json_array(f)
+        else:
+            yield from iter_ndjson(f)
+
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def upsert_batch(cursor, rows):
+    """Inserta el lote en #staging y hace MERGE por nombre contra RPT_ODOO_CORTINAS."""
+    cursor.execute("DELETE FROM #staging")
+    cursor.executemany("INSERT INTO #staging (name, image, Tipo) VALUES (?, ?, ?)", rows)
+    cursor.execute(
+        """
+        MERGE RPT_ODOO_CORTINAS AS target
+        USING #staging AS source
+            ON target.name = source.name
+        WHEN MATCHED THEN
+            UPDATE SET image = source.image, Tipo = source.Tipo
+        WHEN NOT MATCHED THEN
+            INSERT (name, image, Tipo) VALUES (source.name, source.image, source.Tipo);
+        """
+    )
+
+
+def load(path, tipo, batch_size=500, fmt="auto"):
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        # Tabla temporal con los mismos tipos de columna que la tabla destino
+        cursor.execute("SELECT TOP 0 name, image, Tipo INTO #staging FROM RPT_ODOO_CORTINAS")
+        conn.commit()
+
+        total = 0
+        started = time.monotonic()
+        for batch in iter_batches(iter_items(path, fmt), batch_size):
+            # Un nombre repetido dentro del lote rompería el MERGE: gana la última aparición
+            rows = {}
+            for item in batch:
+                name = item["name"].strip()
+                rows[name] = (name, item["image"], tipo)
+            upsert_batch(cursor, list(rows.values()))
+            conn.commit()
+
+            total += len(batch)
+            elapsed = time.monotonic() - started
+            print(f"{total} filas cargadas ({total / elapsed:.1f} filas/s)" if elapsed else f"{total} filas cargadas")
+
+        elapsed = time.monotonic() - started
+        rate = f" ({total / elapsed:.1f} filas/s)" if elapsed else ""
+        print(f"Datos cargados correctamente: {total} filas en {elapsed:.1f} s{rate}.")
+        return total
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carga telas a RPT_ODOO_CORTINAS desde JSON o NDJSON.")
+    parser.add_argument("path", help="Archivo JSON (arreglo) o NDJSON con objetos {name, image}")
+    parser.add_argument("--tipo", required=True, help="Valor de la columna Tipo (p. ej. sheer, blackout)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Filas por lote/commit (default: 500)")
+    parser.add_argument("--format", choices=["auto", "json", "ndjson"], default="auto")
+    args = parser.parse_args(argv)
+
+    # Cargar las variables de entorno desde .env
+    load_dotenv()
+    load(args.path, args.tipo, args.batch_size, args.format)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+import threading
+
+from cache import shared_cache
+
+
+class AttributeIndex:
+    """Nombres de product.attribute y product.attribute.value por id (casi nunca cambian)."""
+
+    def __init__(self, attributes, values):
+        self._lock = threading.Lock()
+        self.attr_names = {a['id']: a['name'] for a in attributes}
+        self.value_names = {}
+        self._add_values(values)
+
+    @classmethod
+    def load(cls, odoo):
+        attributes = odoo.execute_kw('product.attribute', 'search_read', [[]], {'fields': ['id', 'name']})
+        values = odoo.execute_kw('product.attribute.value', 'search_read', [[]],
+                                 {'fields': ['id', 'name', 'attribute_id']})
+        return cls(attributes, values)
+
+    def _add_values(self, values):
+        for v in values:
+            # attribute_id puede venir como tupla
+            self.value_names[v['id']] = {'name': v['name'],
+                                         'attribute_id': v.get('attribute_id')[0] if v.get('attribute_id') else None}
+
+    def ensure(self, odoo, attr_ids, value_ids):
+        """Lee de Odoo solo los ids que aún no están en el índice (atributos o valores creados después)."""
+        missing_attrs = [aid for aid in attr_ids if aid not in self.attr_names]
+        missing_values = [vid for vid in value_ids if vid not in self.value_names]
+        if missing_attrs:
+            attrs = odoo.execute_kw('product.attribute', 'read', [missing_attrs], {'fields': ['id', 'name']})
+            with self._lock:
+                self.attr_names.update({a['id']: a['name'] for a in attrs})
+        if missing_values:
+            values = odoo.execute_kw('product.attribute.value', 'read', [missing_values],
+                                     {'fields': ['id', 'name', 'attribute_id']})
+            with self._lock:
+                self._add_values(values)
+
+
+def get_attribute_index(odoo):
+    """Índice compartido por el proceso; se reconstruye al vencer ATTRIBUTE_CACHE_TTL (segundos)."""
+    return shared_cache("ATTRIBUTE_CACHE_TTL", 600).get_or_load(
+        (odoo.url, odoo.db), lambda: AttributeIndex.load(odoo)
+    )
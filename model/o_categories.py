@@ -0,0 +1,70 @@
+import bisect
+
+from cache import shared_cache
+
+
+class CategoryIndex:
+    """Índice precalculado de product.public.category: id -> ruta completa y ruta -> id."""
+
+    def __init__(self, categories):
+        self.category_dict = {
+            cat['id']: {'name': cat['name'], 'parent_id': cat['parent_id'][0] if cat['parent_id'] else None}
+            for cat in categories
+        }
+        self.paths = {}
+        for cat_id in self.category_dict:
+            self._resolve(cat_id)
+        # Mismo orden que devolvió Odoo
+        self.paths = {cat_id: self.paths[cat_id] for cat_id in self.category_dict}
+        # Con rutas repetidas gana la primera categoría, igual que la búsqueda lineal anterior
+        self.ids_by_path = {}
+        for cat_id, path in self.paths.items():
+            self.ids_by_path.setdefault(path.strip(), cat_id)
+        self._sorted_paths = sorted((path.strip(), cat_id) for cat_id, path in self.paths.items())
+
+    @classmethod
+    def load(cls, odoo):
+        return cls(odoo.execute_kw('product.public.category', 'search_read',
+                                   [[]],
+                                   {'fields': ['id', 'name', 'parent_id']}))
+
+    def _resolve(self, category_id):
+        # Sube hasta el primer ancestro con ruta conocida y rellena la cadena: O(n) en total
+        chain = []
+        while category_id and category_id not in self.paths and category_id in self.category_dict:
+            chain.append(category_id)
+            category_id = self.category_dict[category_id]['parent_id']
+        prefix = self.paths.get(category_id, '')
+        for cid in reversed(chain):
+            name = self.category_dict[cid]['name']
+            prefix = f"{prefix}/{name}" if prefix else name
+            self.paths[cid] = prefix
+
+    def path(self, category_id):
+        return self.paths.get(category_id)
+
+    def find(self, path):
+        """Id de la categoría cuya ruta completa coincide exactamente con ``path``."""
+        return self.ids_by_path.get(path.strip())
+
+    def with_prefix(self, prefix):
+        """Ids de las categorías cuya ruta empieza con ``prefix``."""
+        prefix = prefix.strip()
+        start = bisect.bisect_left(self._sorted_paths, (prefix,))
+        ids = []
+        for path, cat_id in self._sorted_paths[start:]:
+            if not path.startswith(prefix):
+                break
+            ids.append(cat_id)
+        return ids
+
+    def containing(self, fragment):
+        """Ids de las categorías cuya ruta contiene ``fragment``."""
+        return [cat_id for cat_id, path in self.paths.items() if fragment in path]
+
+
+def get_category_index(odoo):
+    """Índice compartido por el proceso; se reconstruye al vencer CATEGORY_CACHE_TTL (segundos)."""
+    return shared_cache("CATEGORY_CACHE_TTL", 600).get_or_load(
+        (odoo.url, odoo.db), lambda: CategoryIndex.load(odoo)
+    )
@@ -1,5 +1,8 @@
 
-import xmlrpc.client 
+from odoo_client import OdooSession
+from model.o_categories import get_category_index
+from images import image_ref
+from catalog_mirror import fresh_mirror
 
 class OProducts:
     def __init__(self, url, db, username, password):
@@ -7,28 +10,21 @@ class OProducts:
         self.db = db
         self.username = username
         self.password = password
+        # Sesión compartida: el uid se autentica una sola vez por proceso
+        self.odoo = OdooSession.get(url, db, username, password)
         self.uid = self.authenticate()
-        self.models = xmlrpc.client.ServerProxy(f'{self.url}/xmlrpc/2/object')
+        # Índice de categorías compartido (se refresca por TTL, no en cada instancia)
+        self.categories = get_category_index(self.odoo)
         self.category_dict = self.get_categories()
 
     def authenticate(self):
-        common = xmlrpc.client.ServerProxy(f'{self.url}/xmlrpc/2/common')
-        return common.authenticate(self.db, self.username, self.password, {})
+        return self.odoo.uid
 
     def get_categories(self):
-        categories = self.models.execute_kw(self.db, self.uid, self.password,
-                                            'product.public.category', 'search_read',
-                                            [[]],
-                                            {'fields': ['id', 'name', 'parent_id']})
-        return {cat['id']: {'name': cat['name'], 'parent_id': cat['parent_id'][0] if cat['parent_id'] else None} for cat in categories}
+        return self.categories.category_dict
 
     def build_path(self, category_id):
-        path = []
-        while category_id:
-            category = self.category_dict[category_id]
-            path.insert(0, category['name'])
-            category_id = category['parent_id']
-        return '/'.join(path)
+        return self.categories.path(category_id) or ''
 
     def get_products_by_category(self, fullpath_filter):
         # products = self.models.execute_kw(self.db, self.uid, self.password,
@@ -36,13 +32,13 @@ class OProducts:
         #                                   [[]],
         #                                   {'fields': ['name', 'public_categ_ids', 'image_1920']})
         # Obtener 20 productos
-        products = self.models.execute_kw(self.db, self.uid, self.password,
+        products = self.odoo.execute_kw(
             'product.template', 'search_read',
             [[]],  # Filtro vacío para obtener todos los productos
-            {'fields': ['name', 'public_categ_ids', 'image_1920'], 'limit': 1}#, 'limit': 20}  # 'limit' para restringir a 20 registros
+            {'fields': ['name', 'public_categ_ids', 'write_date'], 'limit': 1}#, 'limit': 20}  # 'limit' para restringir a 20 registros
         )
 
-        category_paths = {cat_id: self.build_path(cat_id) for cat_id in self.category_dict}
+        category_paths = self.categories.paths
         filtered_products = []
 
         for product in products:
@@ -54,7 +50,7 @@ class OProducts:
                     filtered_products.append({
                         'name': product['name'],
                         'category': path,
-                        'image': product['image_1920']
+                        'image_ref': image_ref('product.template', product)
                     })
                     # uno = True
                     # if (uno):
@@ -71,18 +67,25 @@ class OProducts:
         #                                   'product.template', 'search_read',
         #                                   [[]],
         #                                   {'fields': ['name', 'public_categ_ids', 'image_1920']})
-        # Obtener 20 productos
-        products = self.models.execute_kw(self.db, self.uid, self.password,
+        path_filter = 'CORTINAS/SHADES/TELAS/' + item_name
+        # Resolver localmente las categorías que coinciden y filtrar en Odoo solo por ellas
+        matching_ids = self.categories.containing(path_filter)
+        if not matching_ids:
+            return []
+
+        # Réplica local del catálogo si está activa y al día; si no, Odoo
+        mirror = fresh_mirror(self.odoo.url, self.db)
+        catalog = mirror.session() if mirror else self.odoo
+        products = catalog.execute_kw(
             'product.template', 'search_read',
-            [[]],  # Filtro vacío para obtener todos los productos
-            {'fields': ['name', 'public_categ_ids', 'image_1920']}#, 'limit': 20}  # 'limit' para restringir a 20 registros
+            [[['public_categ_ids', 'in', matching_ids]]],
+            {'fields': ['name', 'public_categ_ids', 'write_date']}#, 'limit': 20}  # 'limit' para restringir a 20 registros
         )
 
-        category_paths = {cat_id: self.build_path(cat_id) for cat_id in self.category_dict}
+        category_paths = self.categories.paths
         filtered_blackout = []
         filtered_sheer = []
         rs = []
-        path_filter = 'CORTINAS/SHADES/TELAS/' + item_name
         for product in products:
             categ_ids = product['public_categ_ids']
             category_names = [category_paths[cid] for cid in categ_ids if cid in category_paths]
@@ -92,7 +95,7 @@ class OProducts:
                     filtered_blackout.append({
                         'name': product['name'],
                         #'category': path,
-                        'image': product['image_1920']
+                        'image_ref': image_ref('product.template', product)
                     })
                 # if 'CORTINAS/SHADES/TELAS/SHEER' in path:
                 #     filtered_sheer.append({
@@ -0,0 +1,214 @@
+"""Cliente XML-RPC compartido para Odoo.
+
+Mantiene una sesión de administrador por proceso: autentica una sola vez,
+cachea el uid por (url, db, usuario) y solo vuelve a autenticar cuando Odoo
+rechaza las credenciales. Las llamadas viajan por un pool acotado de
+conexiones HTTP(S) persistentes (keep-alive), así que el handshake TCP+TLS
+se paga una vez por conexión y no una vez por petición.
+"""
+
+import os
+import queue
+import threading
+import xmlrpc.client
+from contextlib import contextmanager
+
+# Código de falla XML-RPC que Odoo usa para AccessDenied (credenciales inválidas)
+ODOO_FAULT_ACCESS_DENIED = 3
+
+
+class OdooAuthError(Exception):
+    """Odoo rechazó las credenciales de la sesión."""
+
+
+class OdooPoolTimeout(Exception):
+    """No se liberó ninguna conexión del pool dentro del tiempo de espera."""
+
+
+class _TimeoutTransportMixin:
+    """Separa el timeout de conexión del timeout de lectura del socket."""
+
+    connect_timeout = 10.0
+    read_timeout = 120.0
+
+    def make_connection(self, host):
+        conn = super().make_connection(host)
+        conn.timeout = self.connect_timeout
+        return conn
+
+    def send_request(self, host, handler, request_body, debug):
+        connection = self.make_connection(host)
+        if connection.sock is None:
+            connection.connect()
+            connection.sock.settimeout(self.read_timeout)
+        return super().send_request(host, handler, request_body, debug)
+
+
+class KeepAliveTransport(_TimeoutTransportMixin, xmlrpc.client.Transport):
+    pass
+
+
+class KeepAliveSafeTransport(_TimeoutTransportMixin, xmlrpc.client.SafeTransport):
+    pass
+
+
+class XmlRpcPool:
+    """
+    Pool acotado de ServerProxy; cada proxy conserva su propia conexión keep-alive.
+    ``size`` limita también las llamadas simultáneas (max in-flight) hacia Odoo.
+    """
+
+    def __init__(self, endpoint, size=8, connect_timeout=10.0, read_timeout=120.0, acquire_timeout=30.0):
+        self.endpoint = endpoint
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._created = 0
+
+    def _new_proxy(self):
+        transport_cls = KeepAliveSafeTransport if self.endpoint.startswith("https://") else KeepAliveTransport
+        transport = transport_cls()
+        transport.connect_timeout = self.connect_timeout
+        transport.read_timeout = self.read_timeout
+        with self._lock:
+            self._created += 1
+        return xmlrpc.client.ServerProxy(self.endpoint, transport=transport)
+
+    @contextmanager
+    def proxy(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise OdooPoolTimeout(f"Pool XML-RPC agotado ({self.size} conexiones en uso)")
+        try:
+            try:
+                proxy = self._idle.get_nowait()
+            except queue.Empty:
+                proxy = self._new_proxy()
+            with self._lock:
+                self._in_use += 1
+            reusable = False
+            try:
+                yield proxy
+                reusable = True
+            except xmlrpc.client.Fault:
+                # Odoo respondió completo: la conexión sigue siendo válida
+                reusable = True
+                raise
+            finally:
+                with self._lock:
+                    self._in_use -= 1
+                if reusable:
+                    self._idle.put(proxy)
+                else:
+                    proxy("close")()
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "endpoint": self.endpoint,
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "created": self._created,
+            }
+
+
+def _pool_from_env(endpoint):
+    return XmlRpcPool(
+        endpoint,
+        size=int(os.getenv("ODOO_POOL_SIZE", "8")),
+        connect_timeout=float(os.getenv("ODOO_CONNECT_TIMEOUT", "10")),
+        read_timeout=float(os.getenv("ODOO_READ_TIMEOUT", "120")),
+        acquire_timeout=float(os.getenv("ODOO_POOL_WAIT", "30")),
+    )
+
+
+def _is_access_denied(fault: xmlrpc.client.Fault) -> bool:
+    return (
+        fault.faultCode == ODOO_FAULT_ACCESS_DENIED
+        or "AccessDenied" in str(fault.faultString)
+    )
+
+
+class OdooSession:
+    """Sesión XML-RPC thread-safe con uid cacheado."""
+
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, url, db, username, password):
+        self.url = url
+        self.db = db
+        self.username = username
+        self.password = password
+        self._uid = None
+        self._lock = threading.Lock()
+        self._common_pool = _pool_from_env(f"{url}/xmlrpc/2/common")
+        self._object_pool = _pool_from_env(f"{url}/xmlrpc/2/object")
+
+    @classmethod
+    def get(cls, url, db, username, password):
+        """Devuelve la sesión compartida para (url, db, usuario)."""
+        key = (url, db, username)
+        with cls._registry_lock:
+            session = cls._registry.get(key)
+            if session is None or session.password != password:
+                session = cls(url, db, username, password)
+                cls._registry[key] = session
+            return session
+
+    def _authenticate(self, login, password):
+        with self._common_pool.proxy() as common:
+            return common.authenticate(self.db, login, password, {})
+
+    @property
+    def uid(self):
+        uid = self._uid
+        if uid:
+            return uid
+        with self._lock:
+            if not self._uid:
+                uid = self._authenticate(self.username, self.password)
+                if not uid:
+                    raise OdooAuthError(f"Odoo rechazó las credenciales de {self.username}")
+                self._uid = uid
+            return self._uid
+
+    def invalidate(self, uid=None):
+        """Olvida el uid cacheado (solo si sigue siendo ``uid`` cuando se indica)."""
+        with self._lock:
+            if uid is None or self._uid == uid:
+                self._uid = None
+
+    def authenticate_user(self, login, password):
+        """Autentica a un usuario final (no se cachea). Devuelve su uid o False."""
+        return self._authenticate(login, password)
+
+    def execute_kw(self, model, method, args, kwargs=None):
+        """``execute_kw`` con las credenciales de la sesión; reautentica una vez si Odoo las rechaza."""
+        uid = self.uid
+        try:
+            return self._call(uid, model, method, args, kwargs)
+        except xmlrpc.client.Fault as fault:
+            if not _is_access_denied(fault):
+                raise
+            self.invalidate(uid)
+        return self._call(self.uid, model, method, args, kwargs)
+
+    def _call(self, uid, model, method, args, kwargs):
+        with self._object_pool.proxy() as models:
+            if kwargs is None:
+                return models.execute_kw(self.db, uid, self.password, model, method, args)
+            return models.execute_kw(self.db, uid, self.password, model, method, args, kwargs)
+
+    def pool_stats(self):
+        return {
+            "common": self._common_pool.stats(),
+            "object": self._object_pool.stats(),
+        }
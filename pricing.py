@@ -0,0 +1,330 @@
+"""Cálculo de precios por lista de precios (product.pricelist.item)."""
+
+import time
+
+from cache import shared_cache
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: solo lo requiere el cálculo vectorizado
+    np = None
+
+PRICELIST_ITEM_FIELDS = ["fixed_price", "percent_price", "price_discount", "compute_price"]
+
+# Descuento por defecto (%) de las listas 1, 2 y 4 cuando no hay regla aplicable
+DEFAULT_DISCOUNTS = {1: 0.0, 2: 7.0, 4: 19.0}
+
+
+def _many2one_id(value):
+    return value[0] if isinstance(value, (list, tuple)) else value
+
+
+def _apply_pricelist_item_to_base(base, it):
+    if it is None:
+        return None, None
+    if it.get("fixed_price") is not None:
+        return it["fixed_price"], None
+    if it.get("percent_price") is not None:
+        pct = it.get("percent_price") or 0
+        return base * (1 - (pct / 100.0)), pct
+    if it.get("price_discount") is not None:
+        disc = it.get("price_discount") or 0
+        if disc > 1:
+            pct = disc
+            return base * (1 - (pct / 100.0)), pct
+        else:
+            pct = disc * 100.0
+            return base * (1 - float(disc)), pct
+    return None, None
+
+
+def price_with_item(product_data, pricelist_id, item):
+    """Aplica la regla `item` (o None) al producto. Devuelve: (final_price, debug_dict)"""
+    list_price = product_data.get("list_price", 0)
+    std_price = product_data.get("standard_price")
+    try:
+        std_price = float(std_price) if std_price is not None else None
+    except Exception:
+        std_price = None
+
+    # Calcular precio Directo (desde coste)
+    if std_price is not None:
+        direct_from_cost = std_price / 0.65 if 0.65 != 0 else std_price
+        if direct_from_cost < list_price:
+            direct_price = list_price
+            base_used = "list_price"
+        else:
+            direct_price = direct_from_cost
+            base_used = "standard_price"
+    else:
+        direct_price = list_price
+        base_used = "list_price"
+
+    applied_pct = None
+    applied_fixed = None
+    final_price = list_price
+
+    if pricelist_id in (1, 2, 4):
+        defaults = DEFAULT_DISCOUNTS
+        if item:
+            applied, pct = _apply_pricelist_item_to_base(direct_price, item)
+            if applied is not None:
+                final_price = round(applied, 2)
+                applied_pct = pct
+                if item.get("fixed_price") is not None:
+                    applied_fixed = item.get("fixed_price")
+            else:
+                if item.get("compute_price") == "percentage" and item.get("percent_price") is not None:
+                    pct = item.get("percent_price") or 0
+                    final_price = round(direct_price * (1 - (pct/100.0)), 2)
+                    applied_pct = pct
+                else:
+                    final_price = round(direct_price * (1 - (defaults.get(pricelist_id, 0.0)/100.0)), 2)
+        else:
+            final_price = round(direct_price * (1 - (defaults.get(pricelist_id, 0.0)/100.0)), 2)
+    else:
+        # otras listas: aplicar regla si existe
+        if item:
+            applied, pct = _apply_pricelist_item_to_base(product_data.get("list_price", 0), item)
+            if applied is not None:
+                final_price = round(applied, 2)
+                applied_pct = pct
+                if item.get("fixed_price") is not None:
+                    applied_fixed = item.get("fixed_price")
+            elif item.get("compute_price") == "percentage" and item.get("percent_price") is not None:
+                pct = item.get("percent_price") or 0
+                final_price = product_data.get("list_price", 0) * (1 - (pct / 100.0))
+                applied_pct = pct
+
+    debug = {
+        "base_used": base_used,
+        "standard_price": std_price,
+        "list_price": list_price,
+        "direct_price_used": direct_price,
+        "pricelist_id": pricelist_id,
+        "applied_pricelist_item": True if (applied_fixed is not None or applied_pct is not None) else False,
+        "applied_pct": applied_pct,
+        "applied_fixed": applied_fixed
+    }
+
+    return final_price, debug
+
+
+class PricelistRuleIndex:
+    """
+    Reglas compiladas de una lista de precios: product_id -> regla y tmpl_id -> regla.
+    Conserva solo fixed_price, percent_price, price_discount y compute_price.
+    """
+
+    def __init__(self, pricelist_id, items):
+        self.pricelist_id = pricelist_id
+        self.loaded_at = time.time()
+        self.by_product = {}
+        self.by_template = {}
+        # Mismo orden que search_read: la primera regla por clave gana (equivale a limit 1)
+        for it in items:
+            rule = {f: it.get(f) for f in PRICELIST_ITEM_FIELDS}
+            if it.get("product_id"):
+                self.by_product.setdefault(_many2one_id(it["product_id"]), rule)
+            if it.get("product_tmpl_id"):
+                self.by_template.setdefault(_many2one_id(it["product_tmpl_id"]), rule)
+
+    @classmethod
+    def load(cls, odoo, pricelist_id):
+        items = odoo.execute_kw(
+            "product.pricelist.item", "search_read",
+            [[["pricelist_id", "=", pricelist_id], "|", ["product_id", "!=", False], ["product_tmpl_id", "!=", False]]],
+            {"fields": PRICELIST_ITEM_FIELDS + ["product_id", "product_tmpl_id"]}
+        )
+        return cls(pricelist_id, items)
+
+    def item_for(self, product_data):
+        item = self.by_product.get(product_data.get("id"))
+        if item is None and product_data.get("product_tmpl_id"):
+            item = self.by_template.get(_many2one_id(product_data["product_tmpl_id"]))
+        return item
+
+
+def _rule_index_cache():
+    # PRICELIST_CACHE_TTL=0 desactiva el índice y vuelve a las consultas en vivo
+    return shared_cache("PRICELIST_CACHE_TTL", 300)
+
+
+def get_rule_index(odoo, pricelist_id):
+    """Índice de reglas de la lista, cargado perezosamente y renovado al vencer el TTL."""
+    return _rule_index_cache().get_or_load(
+        pricelist_id, lambda: PricelistRuleIndex.load(odoo, pricelist_id)
+    )
+
+
+def invalidate_rule_index(pricelist_id=None):
+    """Descarta el índice de una lista (o de todas) para forzar su recarga."""
+    _rule_index_cache().invalidate(pricelist_id)
+
+
+def rule_index_stats():
+    return _rule_index_cache().stats()
+
+
+# Helper: calcular precio de pricelist para un producto (devuelve precio final y debug)
+def compute_pricelist_price(odoo, product_data, pricelist_id):
+    """product_data debe contener: id, name, list_price, product_tmpl_id, standard_price
+       Devuelve: (final_price, debug_dict)
+    """
+    if _rule_index_cache().ttl > 0:
+        try:
+            item = get_rule_index(odoo, pricelist_id).item_for(product_data)
+            return price_with_item(product_data, pricelist_id, item)
+        except Exception as e:
+            return None, {"error": str(e)}
+
+    try:
+        # Buscar regla específica product.product
+        pricelist_item = odoo.execute_kw(
+            "product.pricelist.item", "search_read",
+            [[
+                ["pricelist_id", "=", pricelist_id],
+                ["product_id", "=", product_data.get("id")]
+            ]],
+            {"fields": PRICELIST_ITEM_FIELDS, "limit": 1}
+        )
+        # fallback a product.template
+        if not pricelist_item and product_data.get("product_tmpl_id"):
+            tmpl_id = _many2one_id(product_data["product_tmpl_id"])
+            pricelist_item = odoo.execute_kw(
+                "product.pricelist.item", "search_read",
+                [[
+                    ["pricelist_id", "=", pricelist_id],
+                    ["product_tmpl_id", "=", tmpl_id]
+                ]],
+                {"fields": PRICELIST_ITEM_FIELDS, "limit": 1}
+            )
+
+        item = pricelist_item[0] if pricelist_item else None
+        return price_with_item(product_data, pricelist_id, item)
+    except Exception as e:
+        return None, {"error": str(e)}
+
+
+def fetch_pricelist_items(odoo, pricelist_id, products):
+    """
+    Reglas aplicables a todos los productos con dos consultas (por variante y por template).
+    Devuelve: {product_id: item o None}, con la misma precedencia que compute_pricelist_price:
+    primero la regla de la variante y, si no hay, la primera regla del template.
+    """
+    product_ids = [p["id"] for p in products]
+    fields = PRICELIST_ITEM_FIELDS + ["product_id", "product_tmpl_id"]
+
+    # search_read devuelve en el orden por defecto del modelo: la primera regla por clave
+    # es la misma que devolvería la búsqueda individual con limit 1
+    by_product = {}
+    if product_ids:
+        for it in odoo.execute_kw(
+            "product.pricelist.item", "search_read",
+            [[["pricelist_id", "=", pricelist_id], ["product_id", "in", product_ids]]],
+            {"fields": fields}
+        ):
+            by_product.setdefault(_many2one_id(it["product_id"]), it)
+
+    by_template = {}
+    missing_tmpl_ids = list({
+        _many2one_id(p["product_tmpl_id"]) for p in products
+        if p["id"] not in by_product and p.get("product_tmpl_id")
+    })
+    if missing_tmpl_ids:
+        for it in odoo.execute_kw(
+            "product.pricelist.item", "search_read",
+            [[["pricelist_id", "=", pricelist_id], ["product_tmpl_id", "in", missing_tmpl_ids]]],
+            {"fields": fields}
+        ):
+            by_template.setdefault(_many2one_id(it["product_tmpl_id"]), it)
+
+    items = {}
+    for p in products:
+        item = by_product.get(p["id"])
+        if item is None and p.get("product_tmpl_id"):
+            item = by_template.get(_many2one_id(p["product_tmpl_id"]))
+        items[p["id"]] = item
+    return items
+
+
+def compute_pricelist_prices(odoo, products, pricelist_id):
+    """Versión por lote de compute_pricelist_price. Devuelve: {product_id: (final_price, debug_dict)}"""
+    try:
+        if _rule_index_cache().ttl > 0:
+            index = get_rule_index(odoo, pricelist_id)
+            items = {p["id"]: index.item_for(p) for p in products}
+        else:
+            items = fetch_pricelist_items(odoo, pricelist_id, products)
+    except Exception as e:
+        return {p["id"]: (None, {"error": str(e)}) for p in products}
+
+    result = {}
+    for p in products:
+        try:
+            result[p["id"]] = price_with_item(p, pricelist_id, items.get(p["id"]))
+        except Exception as e:
+            result[p["id"]] = (None, {"error": str(e)})
+    return result
+
+
+def _float_or_nan(value):
+    try:
+        return float(value) if value is not None else float("nan")
+    except Exception:
+        return float("nan")
+
+
+def rule_columns(products, index):
+    """Columnas para compute_prices_vectorized a partir de productos y un PricelistRuleIndex."""
+    rules = [index.item_for(p) if index is not None else None for p in products]
+    return {
+        "list_price": np.array([p.get("list_price", 0) for p in products], dtype=float),
+        "standard_price": np.array([_float_or_nan(p.get("standard_price")) for p in products], dtype=float),
+        "has_rule": np.array([bool(r) for r in rules], dtype=bool),
+        "fixed_price": np.array([_float_or_nan(r.get("fixed_price")) if r else np.nan for r in rules], dtype=float),
+        "percent_price": np.array([_float_or_nan(r.get("percent_price")) if r else np.nan for r in rules], dtype=float),
+        "price_discount": np.array([_float_or_nan(r.get("price_discount")) if r else np.nan for r in rules], dtype=float),
+    }
+
+
+def compute_prices_vectorized(pricelist_id, list_price, standard_price, has_rule,
+                              fixed_price, percent_price, price_discount):
+    """
+    Mismo resultado que price_with_item, pero sobre arreglos (NaN = campo vacío).
+    Pensado para exportar precios de catálogos completos; no genera diccionarios de debug.
+    """
+    if np is None:
+        raise RuntimeError("numpy no está instalado; es necesario para el cálculo vectorizado")
+
+    has_std = ~np.isnan(standard_price)
+    direct_from_cost = standard_price / 0.65
+    direct_price = np.where(has_std & ~(direct_from_cost < list_price), direct_from_cost, list_price)
+    base = direct_price if pricelist_id in (1, 2, 4) else list_price
+
+    # Misma precedencia que _apply_pricelist_item_to_base: fijo > porcentaje > descuento
+    has_fixed = has_rule & ~np.isnan(fixed_price)
+    has_pct = has_rule & ~has_fixed & ~np.isnan(percent_price)
+    has_disc = has_rule & ~has_fixed & ~has_pct & ~np.isnan(price_discount)
+    applied = has_fixed | has_pct | has_disc
+
+    disc = np.nan_to_num(price_discount)
+    with np.errstate(invalid="ignore"):
+        values = np.where(has_fixed, fixed_price, np.nan)
+        values = np.where(has_pct, base * (1 - (np.nan_to_num(percent_price) / 100.0)), values)
+        values = np.where(has_disc & (disc > 1), base * (1 - (disc / 100.0)), values)
+        values = np.where(has_disc & ~(disc > 1), base * (1 - disc), values)
+
+    if pricelist_id in (1, 2, 4):
+        default = DEFAULT_DISCOUNTS.get(pricelist_id, 0.0)
+        values = np.where(applied, values, direct_price * (1 - (default / 100.0)))
+        rounded = np.ones(len(values), dtype=bool)
+    else:
+        values = np.where(applied, values, list_price)
+        rounded = applied
+
+    # round() de Python por elemento: np.round no redondea igual en los casos límite
+    return np.array(
+        [round(v, 2) if r else v for v, r in zip(values.tolist(), rounded.tolist())],
+        dtype=float,
+    )
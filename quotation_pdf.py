@@ -0,0 +1,305 @@
+"""Descarga y cache en disco de los PDF de cotización (reporte sale.report_saleorder).
+
+La sesión web de Odoo se comparte por proceso y solo se vuelve a autenticar
+cuando expira. Cada PDF se guarda junto con el write_date de la cotización:
+mientras la cotización no cambie, se devuelve el archivo ya generado.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from images import file_lock, write_if_changed
+
+REPORT_NAME = "sale.report_saleorder"
+DOWNLOAD_CHUNK = 64 * 1024
+MANIFEST_NAME = ".pdf-manifest.json"
+MANIFEST_LOCK_NAME = ".pdf-manifest.lock"
+
+
+class OdooWebError(Exception):
+    """Odoo no devolvió un PDF válido."""
+
+
+class PdfQueueFull(Exception):
+    """Hay demasiados PDF pendientes en la cola."""
+
+
+class OdooWebSession:
+    """Sesión HTTP (cookie session_id) contra /web, compartida por proceso."""
+
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, url, db, login, password, timeout=(10, 300)):
+        self.url = url
+        self.db = db
+        self.login = login
+        self.password = password
+        self.timeout = timeout
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+        self._authenticated = False
+
+    @classmethod
+    def get(cls, url, db, login, password):
+        key = (url, db, login)
+        with cls._registry_lock:
+            web = cls._registry.get(key)
+            if web is None or web.password != password:
+                web = cls._registry[key] = cls(url, db, login, password)
+            return web
+
+    def authenticate(self):
+        with self._lock:
+            response = self._session.post(
+                f"{self.url}/web/session/authenticate",
+                json={
+                    "jsonrpc": "2.0",
+                    "method": "call",
+                    "params": {"db": self.db, "login": self.login, "password": self.password},
+                },
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            body = response.json()
+            if body.get("error") or not (body.get("result") or {}).get("uid"):
+                self._authenticated = False
+                raise OdooWebError("Error de autenticación en Odoo (web)")
+            self._authenticated = True
+
+    def _open_report(self, order_id):
+        response = self._session.get(
+            f"{self.url}/report/pdf/{REPORT_NAME}/{order_id}",
+            stream=True,
+            timeout=self.timeout,
+        )
+        # Con la sesión vencida Odoo redirige a /web/login (HTML) en vez de devolver el PDF
+        if response.status_code == 200 and response.headers.get("Content-Type", "").startswith("application/pdf"):
+            return response
+        response.close()
+        if response.status_code in (200, 401, 403) or "/web/login" in response.url:
+            return None
+        raise OdooWebError(f"Error al generar el PDF (HTTP {response.status_code})")
+
+    def open_report(self, order_id):
+        """Respuesta en streaming del PDF; se autentica de nuevo una sola vez si la sesión expiró."""
+        if not self._authenticated:
+            self.authenticate()
+        response = self._open_report(order_id)
+        if response is None:
+            self.authenticate()
+            response = self._open_report(order_id)
+        if response is None:
+            raise OdooWebError("Odoo no devolvió el PDF de la cotización")
+        return response
+
+    def download_report(self, order_id, path):
+        """Descarga el PDF por bloques a un archivo temporal y lo renombra a `path` al terminar."""
+        directory = os.path.dirname(path) or "."
+        with self.open_report(order_id) as response:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".pdf")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK):
+                        f.write(chunk)
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+
+
+class QuotationPdfCache:
+    """
+    Manifiesto {order_id: write_date} de los PDF ya generados en `directory`.
+    Lo comparten los workers: se relee cuando cambia en disco y se escribe
+    leyendo y mezclando bajo un lock de archivo, como el de las imágenes.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._order_locks = {}
+        self._manifest = None
+        self._stamp_seen = None
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def _read(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _load(self):
+        # Llamar con self._lock tomado; otro worker pudo haber agregado PDF desde la última lectura
+        stamp = self._stamp()
+        if self._manifest is None or stamp != self._stamp_seen:
+            self._manifest = self._read()
+            self._stamp_seen = stamp
+        return self._manifest
+
+    def _stamp(self):
+        # write_if_changed reemplaza el archivo: cambia el inodo aunque el mtime coincida
+        try:
+            st = os.stat(self.manifest_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_ino, st.st_size
+
+    def order_lock(self, order_id):
+        # Dos peticiones del mismo PDF no lo descargan dos veces
+        with self._lock:
+            return self._order_locks.setdefault(order_id, threading.Lock())
+
+    def is_fresh(self, order_id, write_date, file_name):
+        with self._lock:
+            entry = self._load().get(str(order_id))
+        return (
+            entry is not None
+            and entry.get("write_date") == write_date
+            and entry.get("file") == file_name
+            and os.path.isfile(os.path.join(self.directory, file_name))
+        )
+
+    def record(self, order_id, write_date, file_name):
+        with self._lock, file_lock(os.path.join(self.directory, MANIFEST_LOCK_NAME)):
+            manifest = self._read()
+            manifest[str(order_id)] = {"write_date": write_date, "file": file_name}
+            data = json.dumps(manifest, sort_keys=True).encode("utf-8")
+            write_if_changed(self.manifest_path, data)
+            self._manifest = manifest
+            self._stamp_seen = self._stamp()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_pdf_cache(directory):
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = _caches[directory] = QuotationPdfCache(directory)
+        return cache
+
+
+def quotation_pdf_name(order_id):
+    return f"Cotizacion_{order_id}.pdf"
+
+
+def render_quotation_pdf(odoo, web, order_id, directory):
+    """
+    Deja en `directory` el PDF de la cotización y devuelve (nombre_de_archivo, cacheado).
+    Solo descarga si el write_date de la cotización cambió desde la última vez.
+    """
+    order = odoo.execute_kw("sale.order", "read", [[int(order_id)]], {"fields": ["write_date"]})
+    if not order:
+        raise LookupError(f"Cotización {order_id} no encontrada")
+    write_date = order[0]["write_date"]
+
+    file_name = quotation_pdf_name(order_id)
+    cache = get_pdf_cache(directory)
+    with cache.order_lock(order_id):
+        if cache.is_fresh(order_id, write_date, file_name):
+            return file_name, True
+        os.makedirs(directory, exist_ok=True)
+        web.download_report(order_id, os.path.join(directory, file_name))
+        cache.record(order_id, write_date, file_name)
+    return file_name, False
+
+
+class PdfJobQueue:
+    """
+    Cola de generación de PDF en segundo plano con un número fijo de workers.
+    `render(order_id)` debe devolver (nombre_de_archivo, cacheado). Los trabajos
+    terminados se conservan `keep_seconds` para poder consultar su estado.
+    """
+
+    def __init__(self, render, workers=4, max_pending=100, keep_seconds=3600):
+        self._render = render
+        self.workers = workers
+        self.max_pending = max_pending
+        self.keep_seconds = keep_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active_by_order = {}  # order_id -> job_id en cola o en ejecución
+
+    def submit(self, order_id):
+        """Encola el PDF de una cotización; si ya hay un trabajo activo para ella, lo reutiliza."""
+        order_id = int(order_id)
+        with self._lock:
+            self._prune()
+            job_id = self._active_by_order.get(order_id)
+            if job_id is not None:
+                return dict(self._jobs[job_id])
+            if len(self._active_by_order) >= self.max_pending:
+                raise PdfQueueFull(f"Cola de PDF llena ({self.max_pending} pendientes)")
+            job_id = uuid.uuid4().hex
+            job = {
+                "job_id": job_id,
+                "order_id": order_id,
+                "status": "queued",
+                "pdf_name": None,
+                "cached": None,
+                "error": None,
+                "created_at": time.time(),
+                "finished_at": None,
+            }
+            self._jobs[job_id] = job
+            self._active_by_order[order_id] = job_id
+            snapshot = dict(job)
+        self._executor.submit(self._run, job_id)
+        return snapshot
+
+    def submit_many(self, order_ids):
+        # Sin repetir cotizaciones dentro del mismo lote
+        return [self.submit(order_id) for order_id in dict.fromkeys(int(o) for o in order_ids)]
+
+    def _run(self, job_id):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = "running"
+            order_id = job["order_id"]
+        try:
+            pdf_name, cached = self._render(order_id)
+            update = {"status": "done", "pdf_name": pdf_name, "cached": cached}
+        except Exception as e:
+            update = {"status": "failed", "error": getattr(e, "detail", None) or str(e)}
+        with self._lock:
+            job.update(update, finished_at=time.time())
+            self._active_by_order.pop(order_id, None)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+            return {"workers": self.workers, "max_pending": self.max_pending, **counts}
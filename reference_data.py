@@ -0,0 +1,75 @@
+"""Ids de referencia de Odoo que casi nunca cambian (término de pago, impuesto, grupo Portal).
+
+Se resuelven una vez por proceso, se renuevan al vencer REFERENCE_DATA_TTL
+(segundos) o a demanda con ``refresh_reference_data``.
+"""
+
+from cache import shared_cache
+
+
+def _load_immediate_payment_term(odoo):
+    # Buscar término de pago "Pago inmediato" (fallback en inglés)
+    term = odoo.execute_kw(
+        "account.payment.term", "search",
+        [[["name", "ilike", "Pago inmediato"]]],
+        {"limit": 1}
+    )
+    if not term:
+        term = odoo.execute_kw(
+            "account.payment.term", "search",
+            [[["name", "ilike", "Immediate Payment"]]],
+            {"limit": 1}
+        )
+    return term[0] if term else None
+
+
+def _load_sale_tax_16(odoo):
+    return odoo.execute_kw(
+        "account.tax", "search",
+        [[["amount", "=", 16], ["type_tax_use", "in", ["sale", "all"]]]],
+        {"limit": 1}
+    )
+
+
+def _load_portal_group(odoo):
+    return odoo.execute_kw(
+        "res.groups", "search",
+        [[["category_id.name", "=", "User types"], ["name", "=", "Portal"]]]
+    )
+
+
+REFERENCE_LOADERS = {
+    "immediate_payment_term": _load_immediate_payment_term,
+    "sale_tax_16": _load_sale_tax_16,
+    "portal_group": _load_portal_group,
+}
+
+
+def _cache():
+    return shared_cache("REFERENCE_DATA_TTL", 3600)
+
+
+def get_reference(odoo, name):
+    loader = REFERENCE_LOADERS[name]
+    return _cache().get_or_load((odoo.url, odoo.db, name), lambda: loader(odoo))
+
+
+def immediate_payment_term_id(odoo):
+    """Id del término de pago inmediato, o None si no existe."""
+    return get_reference(odoo, "immediate_payment_term")
+
+
+def sale_tax_16_ids(odoo):
+    """Ids (lista) del impuesto de venta del 16%."""
+    return get_reference(odoo, "sale_tax_16")
+
+
+def portal_group_ids(odoo):
+    """Ids (lista) del grupo Portal."""
+    return get_reference(odoo, "portal_group")
+
+
+def refresh_reference_data(odoo):
+    """Descarta los valores cacheados y los vuelve a resolver."""
+    _cache().invalidate()
+    return {name: get_reference(odoo, name) for name in REFERENCE_LOADERS}
@@ -0,0 +1,94 @@
+"""Paridad entre compute_prices_vectorized y price_with_item (cálculo por producto)."""
+
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pricing import PricelistRuleIndex, compute_prices_vectorized, price_with_item, rule_columns
+
+PRICELISTS = [1, 2, 4, 3]
+
+STANDARD_PRICES = [None, False, 0, 0.0, 10, 64.99, 100.0, 1234.567]
+
+RULES = [
+    None,
+    {"fixed_price": 80.0, "percent_price": None, "price_discount": None, "compute_price": "fixed"},
+    {"fixed_price": 0.0, "percent_price": None, "price_discount": None, "compute_price": "fixed"},
+    {"fixed_price": None, "percent_price": 15.0, "price_discount": None, "compute_price": "percentage"},
+    {"fixed_price": None, "percent_price": 0.0, "price_discount": None, "compute_price": "percentage"},
+    {"fixed_price": None, "percent_price": None, "price_discount": 0.25, "compute_price": "formula"},
+    {"fixed_price": None, "percent_price": None, "price_discount": 1, "compute_price": "formula"},
+    {"fixed_price": None, "percent_price": None, "price_discount": 12.5, "compute_price": "formula"},
+    {"fixed_price": None, "percent_price": None, "price_discount": None, "compute_price": "formula"},
+]
+
+
+def vectorized(products, pricelist_id, items):
+    index = PricelistRuleIndex(pricelist_id, items)
+    columns = rule_columns(products, index)
+    return compute_prices_vectorized(pricelist_id, **columns).tolist(), index
+
+
+def assert_parity(products, pricelist_id, items):
+    prices, index = vectorized(products, pricelist_id, items)
+    for product, price in zip(products, prices):
+        expected, _ = price_with_item(product, pricelist_id, index.item_for(product))
+        assert price == expected, (pricelist_id, product, index.item_for(product))
+
+
+@pytest.mark.parametrize("pricelist_id", PRICELISTS)
+@pytest.mark.parametrize("standard_price", STANDARD_PRICES)
+@pytest.mark.parametrize("rule", RULES)
+def test_parity_cases(pricelist_id, standard_price, rule):
+    products = [
+        {"id": i, "product_tmpl_id": [101, "T"], "list_price": list_price, "standard_price": standard_price}
+        for i, list_price in enumerate((0.0, 9.99, 100.0, 250.0), start=1)
+    ]
+    items = [dict(rule, product_id=[p["id"], "P"], product_tmpl_id=False) for p in products] if rule else []
+    assert_parity(products, pricelist_id, items)
+
+
+def test_template_rule_fallback():
+    products = [
+        {"id": 1, "product_tmpl_id": [10, "T"], "list_price": 50.0, "standard_price": 20.0},
+        {"id": 2, "product_tmpl_id": [10, "T"], "list_price": 50.0, "standard_price": 40.0},
+        {"id": 3, "product_tmpl_id": [11, "U"], "list_price": 50.0, "standard_price": None},
+    ]
+    items = [
+        {"product_id": [1, "P"], "product_tmpl_id": False, "fixed_price": 33.0,
+         "percent_price": None, "price_discount": None, "compute_price": "fixed"},
+        {"product_id": False, "product_tmpl_id": [10, "T"], "fixed_price": None,
+         "percent_price": 10.0, "price_discount": None, "compute_price": "percentage"},
+    ]
+    for pricelist_id in PRICELISTS:
+        assert_parity(products, pricelist_id, items)
+
+
+@pytest.mark.parametrize("pricelist_id", PRICELISTS)
+def test_parity_randomized(pricelist_id):
+    rng = random.Random(pricelist_id)
+    products = []
+    items = []
+    for product_id in range(1, 2001):
+        products.append({
+            "id": product_id,
+            "product_tmpl_id": [product_id + 100000, "T"],
+            "list_price": round(rng.uniform(0, 5000), rng.choice([0, 2, 4])),
+            "standard_price": rng.choice([None, False, 0, round(rng.uniform(0, 4000), 3)]),
+        })
+        kind = rng.choice(["none", "fixed", "percent", "discount_low", "discount_high", "empty"])
+        if kind == "none":
+            continue
+        rule = {"fixed_price": None, "percent_price": None, "price_discount": None, "compute_price": "formula"}
+        if kind == "fixed":
+            rule.update(fixed_price=round(rng.uniform(0, 3000), 2), compute_price="fixed")
+        elif kind == "percent":
+            rule.update(percent_price=round(rng.uniform(0, 60), 2), compute_price="percentage")
+        elif kind == "discount_low":
+            rule["price_discount"] = round(rng.uniform(0, 1), 3)
+        elif kind == "discount_high":
+            rule["price_discount"] = round(rng.uniform(1.01, 60), 2)
+        items.append(dict(rule, product_id=[product_id, "P"], product_tmpl_id=False))
+    assert_parity(products, pricelist_id, items)